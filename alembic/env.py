@@ -11,7 +11,9 @@ config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-fileConfig(config.config_file_name)
+# Programs passing their own connection keep their logging.
+if "connection" not in config.attributes:
+    fileConfig(config.config_file_name)
 
 # add your model's MetaData object here
 # for 'autogenerate' support
@@ -73,5 +75,8 @@ async def run_migrations_online():
 
 if context.is_offline_mode():
     run_migrations_offline()
+elif "connection" in config.attributes:
+    # sync connection given by program running migrations, e.g. query plan tests
+    do_run_migrations(config.attributes["connection"])
 else:
     asyncio.run(run_migrations_online())
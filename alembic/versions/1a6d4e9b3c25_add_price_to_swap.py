@@ -0,0 +1,43 @@
+"""add price to swap
+
+Revision ID: 1a6d4e9b3c25
+Revises: 7e2b5c8d1f60
+Create Date: 2026-10-19 12:21:07.603948
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1a6d4e9b3c25'
+down_revision = '7e2b5c8d1f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('swap', sa.Column('price', sa.Numeric(), nullable=True))
+    op.execute(
+        'UPDATE swap SET price = to_amount / from_amount WHERE from_amount <> 0'
+    )
+    # index-only scans need visibility map, run VACUUM ANALYZE swap after upgrade
+    op.drop_index('idx_swap_pair_timestamp_desc', table_name='swap')
+    op.create_index(
+        'idx_swap_pair_timestamp_desc',
+        'swap',
+        ['pair_id', sa.text('timestamp DESC')],
+        unique=False,
+        postgresql_include=['price', 'from_amount', 'to_amount', 'block', 'txid'],
+    )
+
+
+def downgrade():
+    op.drop_index('idx_swap_pair_timestamp_desc', table_name='swap')
+    op.create_index(
+        'idx_swap_pair_timestamp_desc',
+        'swap',
+        ['pair_id', sa.text('timestamp DESC')],
+        unique=False,
+    )
+    op.drop_column('swap', 'price')
@@ -0,0 +1,47 @@
+"""add last swap to pair
+
+Revision ID: 3b9e1f7c2a84
+Revises: 5d8e3b6a0c47
+Create Date: 2026-10-19 16:12:31.407215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9e1f7c2a84'
+down_revision = '5d8e3b6a0c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('pair', sa.Column('last_price', sa.Numeric(), nullable=True))
+    op.add_column('pair', sa.Column('last_block', sa.Integer(), nullable=True))
+    op.add_column(
+        'pair', sa.Column('last_txid', sa.Numeric(precision=80), nullable=True)
+    )
+    op.add_column('pair', sa.Column('last_timestamp', sa.BigInteger(), nullable=True))
+    op.execute(
+        """
+        UPDATE pair SET
+            last_price = last_swap.price,
+            last_block = last_swap.block,
+            last_txid = last_swap.txid,
+            last_timestamp = last_swap.timestamp
+        FROM (
+            SELECT DISTINCT ON (pair_id) pair_id, price, block, txid, timestamp
+            FROM swap
+            ORDER BY pair_id, timestamp DESC, id DESC
+        ) AS last_swap
+        WHERE pair.id = last_swap.pair_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_column('pair', 'last_timestamp')
+    op.drop_column('pair', 'last_txid')
+    op.drop_column('pair', 'last_block')
+    op.drop_column('pair', 'last_price')
@@ -0,0 +1,31 @@
+"""add snapshot table
+
+Revision ID: 5d8e3b6a0c47
+Revises: 9f4c2a7e5d13
+Create Date: 2026-10-19 15:02:45.170556
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8e3b6a0c47'
+down_revision = '9f4c2a7e5d13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'snapshot',
+        sa.Column('name', sa.String(length=32), nullable=False),
+        sa.Column('block', sa.Integer(), nullable=False),
+        sa.Column('updated', sa.BigInteger(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+
+
+def downgrade():
+    op.drop_table('snapshot')
@@ -0,0 +1,191 @@
+"""partition swap, burn and buyback by month
+
+Revision ID: 7e2b5c8d1f60
+Revises: c3f1a9d2e7b4
+Create Date: 2026-10-19 11:03:54.218310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e2b5c8d1f60'
+down_revision = 'c3f1a9d2e7b4'
+branch_labels = None
+depends_on = None
+
+# partitions are created this far ahead of now, the importer keeps extending them
+MONTHS_AHEAD = 2
+
+# create monthly partitions of <parent> covering [from_ts, to_ts], timestamps in ms
+CREATE_PARTITIONS_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent text, from_ts bigint, to_ts bigint)
+RETURNS void LANGUAGE plpgsql AS $$
+DECLARE
+    month_start timestamp := date_trunc('month', to_timestamp(from_ts / 1000.0) AT TIME ZONE 'UTC');
+    month_end timestamp;
+BEGIN
+    WHILE month_start <= to_timestamp(to_ts / 1000.0) AT TIME ZONE 'UTC' LOOP
+        month_end := month_start + interval '1 month';
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%s) TO (%s)',
+            parent || '_' || to_char(month_start, 'YYYY_MM'),
+            parent,
+            extract(epoch FROM month_start)::bigint * 1000,
+            extract(epoch FROM month_end)::bigint * 1000
+        );
+        month_start := month_end;
+    END LOOP;
+END;
+$$
+"""
+
+SWAP_COLUMNS = (
+    "id, txid, block, timestamp, xor_fee, pair_id, from_amount, to_amount,"
+    " filter_mode, swap_fee_amount, leg"
+)
+TOKEN_AMOUNT_COLUMNS = "id, block, timestamp, token_id, amount"
+
+
+def swap_columns(id_default):
+    return [
+        sa.Column('id', sa.Integer(), server_default=id_default, nullable=False),
+        sa.Column('txid', sa.Numeric(precision=80), nullable=True),
+        sa.Column('block', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.BigInteger(), nullable=False),
+        sa.Column('xor_fee', sa.Numeric(precision=40), nullable=False),
+        sa.Column('pair_id', sa.Integer(), nullable=False),
+        sa.Column('from_amount', sa.Numeric(), nullable=False),
+        sa.Column('to_amount', sa.Numeric(), nullable=False),
+        sa.Column('filter_mode', sa.String(length=32), nullable=False),
+        sa.Column('swap_fee_amount', sa.Numeric(), nullable=True),
+        sa.Column('leg', sa.Integer(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['pair_id'], ['pair.id']),
+    ]
+
+
+def token_amount_columns(id_default):
+    return [
+        sa.Column('id', sa.Integer(), server_default=id_default, nullable=False),
+        sa.Column('block', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.BigInteger(), nullable=False),
+        sa.Column('token_id', sa.Numeric(precision=80), nullable=False),
+        sa.Column('amount', sa.Numeric(), nullable=False),
+        sa.ForeignKeyConstraint(['token_id'], ['token.id']),
+    ]
+
+
+def detach_old_table(table):
+    """
+    Rename <table> out of the way, keeping its id sequence for the new table.
+    """
+    op.rename_table(table, table + '_old')
+    op.execute(
+        'ALTER TABLE {0}_old RENAME CONSTRAINT {0}_pkey TO {0}_old_pkey'.format(table)
+    )
+
+
+def move_rows(table, columns):
+    """
+    Copy rows from the renamed table into the new <table> and drop the old one.
+    """
+    op.execute('ALTER SEQUENCE {0}_id_seq OWNED BY {0}.id'.format(table))
+    op.execute(
+        'INSERT INTO {0} ({1}) SELECT {1} FROM {0}_old'.format(table, columns)
+    )
+    op.drop_table(table + '_old')
+
+
+def create_partitions(table):
+    op.execute(
+        """
+        SELECT create_monthly_partitions(
+            '{0}',
+            coalesce(min(timestamp), extract(epoch FROM now())::bigint * 1000),
+            extract(epoch FROM now() + interval '{1} months')::bigint * 1000
+        )
+        FROM {0}_old
+        """.format(table, MONTHS_AHEAD)
+    )
+
+
+def upgrade():
+    op.execute(CREATE_PARTITIONS_FUNCTION)
+
+    detach_old_table('swap')
+    op.drop_constraint('uq_swap_block_txid_pair_leg', 'swap_old', type_='unique')
+    op.drop_index('idx_swap_pair_timestamp_desc', table_name='swap_old')
+    op.drop_index('ix_swap_timestamp', table_name='swap_old')
+    # primary and unique keys of partitioned table must include partition key
+    op.create_table(
+        'swap',
+        *swap_columns(sa.text("nextval('swap_id_seq')")),
+        sa.PrimaryKeyConstraint('id', 'timestamp'),
+        sa.UniqueConstraint(
+            'block', 'txid', 'pair_id', 'leg', 'timestamp',
+            name='uq_swap_block_txid_pair_leg',
+        ),
+        postgresql_partition_by='RANGE (timestamp)',
+    )
+    op.create_index(
+        'idx_swap_pair_timestamp_desc',
+        'swap',
+        ['pair_id', sa.text('timestamp DESC')],
+        unique=False,
+    )
+    op.create_index(op.f('ix_swap_timestamp'), 'swap', ['timestamp'], unique=False)
+    create_partitions('swap')
+    move_rows('swap', SWAP_COLUMNS)
+
+    for table in ('burn', 'buyback'):
+        detach_old_table(table)
+        op.drop_index('ix_{}_timestamp'.format(table), table_name=table + '_old')
+        op.create_table(
+            table,
+            *token_amount_columns(sa.text("nextval('{}_id_seq')".format(table))),
+            sa.PrimaryKeyConstraint('id', 'timestamp'),
+            postgresql_partition_by='RANGE (timestamp)',
+        )
+        op.create_index(
+            op.f('ix_{}_timestamp'.format(table)), table, ['timestamp'], unique=False
+        )
+        create_partitions(table)
+        move_rows(table, TOKEN_AMOUNT_COLUMNS)
+
+
+def downgrade():
+    detach_old_table('swap')
+    op.drop_constraint('uq_swap_block_txid_pair_leg', 'swap_old', type_='unique')
+    op.create_table(
+        'swap',
+        *swap_columns(sa.text("nextval('swap_id_seq')")),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint(
+            'block', 'txid', 'pair_id', 'leg', name='uq_swap_block_txid_pair_leg'
+        ),
+    )
+    move_rows('swap', SWAP_COLUMNS)
+    op.create_index(
+        'idx_swap_pair_timestamp_desc',
+        'swap',
+        ['pair_id', sa.text('timestamp DESC')],
+        unique=False,
+    )
+    op.create_index(op.f('ix_swap_timestamp'), 'swap', ['timestamp'], unique=False)
+
+    for table in ('burn', 'buyback'):
+        detach_old_table(table)
+        op.create_table(
+            table,
+            *token_amount_columns(sa.text("nextval('{}_id_seq')".format(table))),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        move_rows(table, TOKEN_AMOUNT_COLUMNS)
+        op.create_index(
+            op.f('ix_{}_timestamp'.format(table)), table, ['timestamp'], unique=False
+        )
+
+    op.execute(
+        'DROP FUNCTION create_monthly_partitions(text, bigint, bigint)'
+    )
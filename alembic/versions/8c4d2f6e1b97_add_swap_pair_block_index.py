@@ -0,0 +1,31 @@
+"""add swap pair block index
+
+Revision ID: 8c4d2f6e1b97
+Revises: 3b9e1f7c2a84
+Create Date: 2026-10-19 18:02:45.118306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4d2f6e1b97'
+down_revision = '3b9e1f7c2a84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # index-only scans need visibility map, run VACUUM ANALYZE swap after upgrade
+    op.create_index(
+        'idx_swap_pair_block_desc',
+        'swap',
+        ['pair_id', sa.text('block DESC')],
+        unique=False,
+        postgresql_include=['price', 'timestamp'],
+    )
+
+
+def downgrade():
+    op.drop_index('idx_swap_pair_block_desc', table_name='swap')
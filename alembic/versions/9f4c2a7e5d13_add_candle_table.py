@@ -0,0 +1,79 @@
+"""add candle table
+
+Revision ID: 9f4c2a7e5d13
+Revises: 1a6d4e9b3c25
+Create Date: 2026-10-19 13:40:12.884301
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f4c2a7e5d13'
+down_revision = '1a6d4e9b3c25'
+branch_labels = None
+depends_on = None
+
+CANDLE_COLUMNS = (
+    "pair_id, interval, timestamp, open, high, low, close,"
+    " from_volume, to_volume, swaps, open_timestamp, close_timestamp"
+)
+
+# (interval, interval it is aggregated from) in seconds
+ROLLUPS = ((300, 60), (3600, 300), (86400, 3600))
+
+
+def upgrade():
+    op.create_table(
+        'candle',
+        sa.Column('pair_id', sa.Integer(), nullable=False),
+        sa.Column('interval', sa.Integer(), nullable=False),
+        sa.Column('timestamp', sa.BigInteger(), nullable=False),
+        sa.Column('open', sa.Numeric(), nullable=False),
+        sa.Column('high', sa.Numeric(), nullable=False),
+        sa.Column('low', sa.Numeric(), nullable=False),
+        sa.Column('close', sa.Numeric(), nullable=False),
+        sa.Column('from_volume', sa.Numeric(), nullable=False),
+        sa.Column('to_volume', sa.Numeric(), nullable=False),
+        sa.Column('swaps', sa.Integer(), nullable=False),
+        sa.Column('open_timestamp', sa.BigInteger(), nullable=False),
+        sa.Column('close_timestamp', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['pair_id'], ['pair.id']),
+        sa.PrimaryKeyConstraint('pair_id', 'interval', 'timestamp'),
+    )
+    # build candles of already imported swaps
+    op.execute(
+        """
+        INSERT INTO candle ({})
+        SELECT
+            pair_id, 60, timestamp - timestamp % 60000,
+            (array_agg(price ORDER BY timestamp, id))[1], max(price), min(price),
+            (array_agg(price ORDER BY timestamp DESC, id DESC))[1],
+            sum(from_amount) / 1000000000000000000,
+            sum(to_amount) / 1000000000000000000,
+            count(*), min(timestamp), max(timestamp)
+        FROM swap
+        WHERE price IS NOT NULL
+        GROUP BY 1, 3
+        """.format(CANDLE_COLUMNS)
+    )
+    for interval, source in ROLLUPS:
+        op.execute(
+            """
+            INSERT INTO candle ({0})
+            SELECT
+                pair_id, {1}, timestamp - timestamp % {2},
+                (array_agg(open ORDER BY timestamp))[1], max(high), min(low),
+                (array_agg(close ORDER BY timestamp DESC))[1],
+                sum(from_volume), sum(to_volume),
+                sum(swaps), min(open_timestamp), max(close_timestamp)
+            FROM candle
+            WHERE interval = {3}
+            GROUP BY 1, 3
+            """.format(CANDLE_COLUMNS, interval, interval * 1000, source)
+        )
+
+
+def downgrade():
+    op.drop_table('candle')
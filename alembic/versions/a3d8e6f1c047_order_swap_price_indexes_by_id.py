@@ -0,0 +1,45 @@
+"""order swap price indexes by id
+
+Revision ID: a3d8e6f1c047
+Revises: f7c3a9e2d416
+Create Date: 2026-10-19 23:12:40.615823
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d8e6f1c047'
+down_revision = 'f7c3a9e2d416'
+branch_labels = None
+depends_on = None
+
+# name -> (ordered column, included columns)
+INDEXES = {
+    'idx_swap_pair_timestamp_desc': (
+        'timestamp', ['price', 'from_amount', 'to_amount', 'block', 'txid']
+    ),
+    'idx_swap_pair_block_desc': ('block', ['price', 'timestamp']),
+}
+
+
+def recreate_indexes(by_id):
+    for name, (column, include) in INDEXES.items():
+        op.drop_index(name, table_name='swap')
+        columns = ['pair_id', sa.text(column + ' DESC')]
+        if by_id:
+            # swaps of the same block and timestamp in order of import
+            columns.append(sa.text('id DESC'))
+        op.create_index(
+            name, 'swap', columns, unique=False, postgresql_include=include
+        )
+
+
+def upgrade():
+    # index-only scans need visibility map, run VACUUM ANALYZE swap after upgrade
+    recreate_indexes(by_id=True)
+
+
+def downgrade():
+    recreate_indexes(by_id=False)
@@ -0,0 +1,42 @@
+"""add natural key to burn and buyback
+
+Revision ID: b6e2d9f4a158
+Revises: a3d8e6f1c047
+Create Date: 2026-10-19 23:14:52.730615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2d9f4a158'
+down_revision = 'a3d8e6f1c047'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # events of rows imported so far are unknown, they are left NULL and so
+    # never conflict with each other
+    for table in ('burn', 'buyback'):
+        op.add_column(table, sa.Column('event_index', sa.Integer(), nullable=True))
+        # unique keys of partitioned tables include partition key
+        op.create_unique_constraint(
+            'uq_{}_block_token_event'.format(table),
+            table,
+            ['block', 'token_id', 'event_index', 'timestamp'],
+        )
+        # lookups by block are served by the unique key
+        op.drop_index(op.f('ix_{}_block'.format(table)), table_name=table)
+
+
+def downgrade():
+    for table in ('burn', 'buyback'):
+        op.create_index(
+            op.f('ix_{}_block'.format(table)), table, ['block'], unique=False
+        )
+        op.drop_constraint(
+            'uq_{}_block_token_event'.format(table), table, type_='unique'
+        )
+        op.drop_column(table, 'event_index')
@@ -0,0 +1,59 @@
+"""add natural key to swap
+
+Revision ID: c3f1a9d2e7b4
+Revises: a93bf2ae653f
+Create Date: 2026-10-19 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f1a9d2e7b4'
+down_revision = 'a93bf2ae653f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'swap',
+        sa.Column('leg', sa.Integer(), nullable=False, server_default='0'),
+    )
+    # drop duplicates left by overlapping imports, keep the earliest row
+    op.execute(
+        """
+        DELETE FROM swap WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY block, txid, pair_id, from_amount, to_amount
+                    ORDER BY id
+                ) AS n
+                FROM swap
+            ) duplicates
+            WHERE n > 1
+        )
+        """
+    )
+    # legs of multi-hop swaps were inserted in route order
+    op.execute(
+        """
+        UPDATE swap SET leg = legs.leg
+        FROM (
+            SELECT id, row_number() OVER (
+                PARTITION BY block, txid ORDER BY id
+            ) - 1 AS leg
+            FROM swap
+        ) legs
+        WHERE swap.id = legs.id AND legs.leg > 0
+        """
+    )
+    op.create_unique_constraint(
+        'uq_swap_block_txid_pair_leg', 'swap', ['block', 'txid', 'pair_id', 'leg']
+    )
+
+
+def downgrade():
+    op.drop_constraint('uq_swap_block_txid_pair_leg', 'swap', type_='unique')
+    op.drop_column('swap', 'leg')
@@ -0,0 +1,30 @@
+"""add candle interval timestamp index
+
+Revision ID: d2a6f8c3e915
+Revises: 8c4d2f6e1b97
+Create Date: 2026-10-19 19:24:12.604871
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a6f8c3e915'
+down_revision = '8c4d2f6e1b97'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # index-only scans need visibility map, run VACUUM ANALYZE candle after upgrade
+    op.create_index(
+        'idx_candle_interval_timestamp',
+        'candle',
+        ['interval', 'timestamp'],
+        unique=False,
+        postgresql_include=['pair_id', 'high', 'low'],
+    )
+
+
+def downgrade():
+    op.drop_index('idx_candle_interval_timestamp', table_name='candle')
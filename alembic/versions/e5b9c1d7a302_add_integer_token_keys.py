@@ -0,0 +1,81 @@
+"""add integer token keys
+
+Revision ID: e5b9c1d7a302
+Revises: d2a6f8c3e915
+Create Date: 2026-10-19 20:41:37.520914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b9c1d7a302'
+down_revision = 'd2a6f8c3e915'
+branch_labels = None
+depends_on = None
+
+# columns referencing token
+TOKEN_COLUMNS = (
+    ('pair', 'from_token_id'),
+    ('pair', 'to_token_id'),
+    ('burn', 'token_id'),
+    ('buyback', 'token_id'),
+)
+
+
+def replace_column(table, column, type_, token_column, value_column):
+    """
+    Replace <column> of <table> referencing token.<token_column> with column of
+    <type_> holding token.<value_column>. Dropping old column drops its foreign key.
+    """
+    op.add_column(table, sa.Column(column + '_new', type_, nullable=True))
+    op.execute(
+        'UPDATE {0} SET {1}_new = token.{3} FROM token'
+        ' WHERE token.{2} = {0}.{1}'.format(table, column, token_column, value_column)
+    )
+    op.drop_column(table, column)
+    op.alter_column(table, column + '_new', new_column_name=column, nullable=False)
+
+
+def upgrade():
+    op.alter_column('token', 'id', new_column_name='asset_id')
+    # existing tokens are numbered in order of asset ids
+    op.add_column('token', sa.Column('id', sa.Integer(), nullable=True))
+    op.execute('CREATE SEQUENCE token_id_seq OWNED BY token.id')
+    op.execute(
+        'UPDATE token SET id = key FROM ('
+        'SELECT asset_id, nextval(\'token_id_seq\') AS key'
+        ' FROM (SELECT asset_id FROM token ORDER BY asset_id) AS ordered'
+        ') AS keys WHERE token.asset_id = keys.asset_id'
+    )
+    op.alter_column(
+        'token',
+        'id',
+        nullable=False,
+        server_default=sa.text("nextval('token_id_seq')"),
+    )
+    for table, column in TOKEN_COLUMNS:
+        replace_column(table, column, sa.Integer(), 'asset_id', 'id')
+    op.drop_constraint('token_pkey', 'token', type_='primary')
+    op.create_primary_key('token_pkey', 'token', ['id'])
+    op.create_index(op.f('ix_token_asset_id'), 'token', ['asset_id'], unique=True)
+    for table, column in TOKEN_COLUMNS:
+        op.create_foreign_key(
+            '{}_{}_fkey'.format(table, column), table, 'token', [column], ['id']
+        )
+
+
+def downgrade():
+    for table, column in TOKEN_COLUMNS:
+        replace_column(table, column, sa.Numeric(precision=80), 'id', 'asset_id')
+    op.drop_index(op.f('ix_token_asset_id'), table_name='token')
+    op.drop_constraint('token_pkey', 'token', type_='primary')
+    # drops owned sequence too
+    op.drop_column('token', 'id')
+    op.alter_column('token', 'asset_id', new_column_name='id')
+    op.create_primary_key('token_pkey', 'token', ['id'])
+    for table, column in TOKEN_COLUMNS:
+        op.create_foreign_key(
+            '{}_{}_fkey'.format(table, column), table, 'token', [column], ['id']
+        )
@@ -0,0 +1,39 @@
+"""add block indexes
+
+Revision ID: f7c3a9e2d416
+Revises: e5b9c1d7a302
+Create Date: 2026-10-19 21:37:05.281946
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7c3a9e2d416'
+down_revision = 'e5b9c1d7a302'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # indexes of partitioned tables are created on their partitions too, and on
+    # partitions created later
+    for table in ('swap', 'burn', 'buyback'):
+        op.create_index(
+            'brin_{}_block_timestamp'.format(table),
+            table,
+            ['block', 'timestamp'],
+            unique=False,
+            postgresql_using='brin',
+        )
+    for table in ('burn', 'buyback'):
+        op.create_index(
+            op.f('ix_{}_block'.format(table)), table, ['block'], unique=False
+        )
+
+
+def downgrade():
+    for table in ('burn', 'buyback'):
+        op.drop_index(op.f('ix_{}_block'.format(table)), table_name=table)
+    for table in ('swap', 'burn', 'buyback'):
+        op.drop_index('brin_{}_block_timestamp'.format(table), table_name=table)
@@ -0,0 +1,117 @@
+"""
+Time- and volume-weighted average prices of pairs over arbitrary windows, reduced
+with NumPy from swap amounts fetched as columns.
+"""
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+import queries
+from price_history import lookup_price
+
+# number of (pair, window) results kept
+CACHE_SIZE = 1024
+
+
+async def fetch_swaps(
+    session, pair_ids: list, base_pair_id: int, from_: int, to: int
+):
+    """
+    Return timestamps, base amounts and quote amounts of swaps of pair and its
+    reverse in [<from_>, <to>) as arrays in timestamp order.
+    """
+    rows = (await session.execute(queries.window_swaps(pair_ids, from_, to))).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+    timestamps, swap_pair_ids, from_amounts, to_amounts = zip(*rows)
+    is_base = np.array(swap_pair_ids) == base_pair_id
+    from_amounts = np.array(from_amounts, dtype=np.float64)
+    to_amounts = np.array(to_amounts, dtype=np.float64)
+    return (
+        np.array(timestamps, dtype=np.int64),
+        np.where(is_base, from_amounts, to_amounts),
+        np.where(is_base, to_amounts, from_amounts),
+    )
+
+
+def average_prices(timestamps, base, quote, from_: int, to: int, open_price=None):
+    """
+    Return dict with TWAP and VWAP (None if there are no swaps) of swaps given as
+    arrays, base and quote volumes and number of swaps.
+    Price of each swap holds until next one, <open_price> from start of window.
+    """
+    base_volume = base.sum()
+    result = {
+        "vwap": float(quote.sum() / base_volume) if base_volume else None,
+        "base_volume": float(base_volume),
+        "quote_volume": float(quote.sum()),
+        "swaps": len(timestamps),
+        "twap": None,
+    }
+    valid = base > 0
+    starts = timestamps[valid]
+    prices = quote[valid] / base[valid]
+    if open_price is not None:
+        starts = np.concatenate(([from_], starts))
+        prices = np.concatenate(([open_price], prices))
+    if len(prices):
+        durations = np.diff(np.append(starts, to))
+        total = durations.sum()
+        result["twap"] = float(prices @ durations / total if total else prices[-1])
+    return result
+
+
+class Averages:
+    """
+    Least recently used average_prices() results by pair and window, valid until
+    next import or new swaps of the pair.
+    """
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        # (pair ids, from, to) -> (import version, result)
+        self.results = OrderedDict()
+
+    async def get(
+        self,
+        session,
+        pair_ids: list,
+        base_pair_id: int,
+        from_: int,
+        to: int,
+        version=None,
+    ):
+        """
+        Return average_prices() of pair in [<from_>, <to>) as of import <version>,
+        not cached if version is unknown.
+        """
+        key = (tuple(pair_ids), from_, to)
+        cached = self.results.get(key)
+        if version is not None and cached and cached[0] == version:
+            self.results.move_to_end(key)
+            return cached[1]
+        timestamps, base, quote = await fetch_swaps(
+            session, pair_ids, base_pair_id, from_, to
+        )
+        # price in effect at start of window
+        last = await lookup_price(
+            session, pair_ids, base_pair_id, "timestamp", from_ - 1
+        )
+        open_price = last[0] if last and not math.isnan(last[0]) else None
+        result = average_prices(timestamps, base, quote, from_, to, open_price)
+        if version is not None:
+            self.results[key] = (version, result)
+            self.results.move_to_end(key)
+            if len(self.results) > self.size:
+                self.results.popitem(last=False)
+        return result
+
+    def invalidate(self, pair_ids):
+        """
+        Drop results of pairs with new swaps.
+        """
+        changed = set(pair_ids)
+        for key in list(self.results):
+            if changed.intersection(key[0]):
+                del self.results[key]
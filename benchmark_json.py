@@ -0,0 +1,71 @@
+"""
+Benchmark of render_json on /tickers/-like reply of 1,000 pairs.
+Compares it with previous implementation (repr of reply patched into JSON).
+Run: python benchmark_json.py
+"""
+import json
+import random
+from timeit import repeat
+
+from market import FormattedFloat, render_json
+
+PAIRS = 1000
+REPEAT = 5
+NUMBER = 20
+
+
+def make_tickers(count):
+    random.seed(0)
+    tickers = []
+    for i in range(count):
+        base = "0x%064x" % (i + 1)
+        quote = "0x%064x" % 0x200000
+        tickers.append({
+            "ticker_id": base + "_" + quote,
+            "base_currency": base,
+            "base_name": "Token %i" % i,
+            "base_symbol": "T%i" % i,
+            "target_currency": quote,
+            "target_name": "SORA",
+            "target_symbol": "XOR",
+            "last_price": FormattedFloat(random.random() * 1000),
+            "base_volume": FormattedFloat(random.random() * 10 ** 6),
+            "target_volume": FormattedFloat(random.random() * 10 ** 6),
+            "liquidity_in_usd": FormattedFloat(random.random() * 10 ** 7),
+            "high": FormattedFloat(random.random() * 1000),
+            "low": FormattedFloat(random.random() / 1000),
+        })
+    return tickers
+
+
+class LegacyEncoder(json.JSONEncoder):
+    def encode(self, val):
+        return val
+
+
+def render_json_legacy(content) -> bytes:
+    return json.dumps(
+        str(content).replace("'", "\"").replace(", ", ",").replace(": ", ":"),
+        cls=LegacyEncoder,
+    ).encode("utf-8")
+
+
+def measure(name, render, content):
+    size = len(render(content))
+    best = min(repeat(lambda: render(content), repeat=REPEAT, number=NUMBER)) / NUMBER
+    print(
+        "%-8s %8i bytes %9.3f ms %10.1f MB/s"
+        % (name, size, best * 1000, size / best / 10 ** 6)
+    )
+
+
+def main():
+    tickers = make_tickers(PAIRS)
+    # both produce the same numbers
+    assert json.loads(render_json(tickers)) == json.loads(render_json_legacy(tickers))
+    measure("legacy", render_json_legacy, tickers)
+    measure("orjson", render_json, tickers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+In-process fan-out of per-pair market updates to push (SSE) subscribers.
+Pairs are read from DB once per import no matter how many clients are subscribed.
+"""
+import asyncio
+import logging
+
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+
+from market import FormattedFloat, render_json
+from models import Pair
+
+# max number of events queued for subscriber, slower ones are disconnected
+QUEUE_SIZE = 64
+
+
+def format_event(name: str, data) -> bytes:
+    """
+    Serialize server-sent event.
+    """
+    return b"event: " + name.encode() + b"\ndata: " + render_json(data) + b"\n\n"
+
+
+def pair_state(pair: Pair) -> dict:
+    """
+    Return pushed information on <pair>, volumes are of last 24h.
+    """
+    return {
+        "pair_id": pair.from_token.hash + "_" + pair.to_token.hash,
+        "base_symbol": pair.from_token.symbol,
+        "quote_symbol": pair.to_token.symbol,
+        "last_price": FormattedFloat(pair.last_price or 0),
+        "last_block": pair.last_block,
+        "base_volume": FormattedFloat(pair.from_volume or 0),
+        "quote_volume": FormattedFloat(pair.to_volume or 0),
+        "base_liquidity": FormattedFloat(pair.from_token_liquidity or 0),
+        "quote_liquidity": FormattedFloat(pair.to_token_liquidity or 0),
+    }
+
+
+class Broadcaster:
+    """
+    Keep last known state of pairs and push changed ones to all subscribers.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        # pair id -> pair_state()
+        self.state = {}
+        # (block, updated) of import pairs were last reloaded for, None if nothing
+        # was imported yet
+        self.version = None
+        self.loaded = False
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Return queue receiving serialized events, None means subscriber was dropped.
+        """
+        queue = asyncio.Queue(QUEUE_SIZE)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def snapshot(self) -> bytes:
+        """
+        Return event with state of all pairs, sent to new subscribers.
+        """
+        return format_event("snapshot", list(self.state.values()))
+
+    def publish(self, event: bytes):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # client does not keep up, end its stream so it reconnects
+                self.unsubscribe(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def refresh(self, session, pair_ids=None, version=None):
+        """
+        Reload state of all pairs or <pair_ids> and publish ones changed.
+        Reloaded state of all pairs is of import <version>.
+        """
+        q = select(Pair).options(
+            selectinload(Pair.from_token), selectinload(Pair.to_token)
+        )
+        if pair_ids is not None:
+            q = q.where(Pair.id.in_(pair_ids))
+        changed = []
+        for pair in await session.scalars(q):
+            state = pair_state(pair)
+            if self.state.get(pair.id) != state:
+                self.state[pair.id] = state
+                changed.append(state)
+        if pair_ids is None:
+            self.version = version
+            self.loaded = True
+        if changed:
+            self.publish(format_event("update", changed))
+
+    async def poll(self, session_factory, interval: float, get_version):
+        """
+        Refresh pairs whenever import version returned by <get_version>(session)
+        changes, checking every <interval> s. Pairs are loaded once before first
+        import.
+        """
+        while True:
+            try:
+                async with session_factory() as session:
+                    version = await get_version(session)
+                    if not self.loaded or version != self.version:
+                        await self.refresh(session, version=version)
+            except Exception:
+                logging.exception("Failed to refresh pairs for subscribers")
+            await asyncio.sleep(interval)
@@ -0,0 +1,67 @@
+"""
+Batch loading of GraphQL relationships: keys requested by resolvers during one event
+loop iteration are loaded with a single query instead of one query per object.
+"""
+import asyncio
+
+from sqlalchemy.future import select
+
+from models import Pair, Token
+
+
+class DataLoader:
+    """
+    Collect keys passed to load() and resolve them with one batch_load(keys) call,
+    which returns dict of key -> value. Missing keys resolve to None.
+    Results are cached for the lifetime of the loader.
+    """
+
+    def __init__(self, batch_load):
+        self.batch_load = batch_load
+        self.cache = {}
+        self.pending = []
+
+    def load(self, key):
+        """
+        Return future of value of <key>.
+        """
+        if key not in self.cache:
+            loop = asyncio.get_event_loop()
+            self.cache[key] = loop.create_future()
+            if not self.pending:
+                # dispatch after resolvers scheduled in this iteration requested their keys
+                loop.call_soon(lambda: asyncio.ensure_future(self.dispatch()))
+            self.pending.append(key)
+        return self.cache[key]
+
+    async def dispatch(self):
+        keys, self.pending = self.pending, []
+        try:
+            values = await self.batch_load(keys)
+        except Exception as e:
+            for key in keys:
+                self.cache.pop(key).set_exception(e)
+            return
+        for key in keys:
+            self.cache[key].set_result(values.get(key))
+
+
+class Loaders:
+    """
+    DataLoaders of single GraphQL request.
+    Queries are serialized since AsyncSession can't run them concurrently.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = asyncio.Lock()
+        self.pair = DataLoader(lambda ids: self.load_by_id(Pair, ids))
+        self.token = DataLoader(lambda ids: self.load_by_id(Token, ids))
+
+    async def execute(self, q):
+        async with self.lock:
+            return await self.db.execute(q)
+
+    async def load_by_id(self, model, ids):
+        rows = await self.execute(select(model).where(model.id.in_(ids)))
+        return {row.id: row for row, in rows}
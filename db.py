@@ -1,11 +1,62 @@
 import decouple
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
+from replicas import ReadReplicas
+
 DEBUG = decouple.config("DEBUG", default=False, cast=bool)
 
-engine = create_async_engine(decouple.config("DATABASE_URL"), echo=DEBUG)
+# read-only replicas serving web API, comma-separated; primary is used if not set
+REPLICA_URLS = decouple.config("DATABASE_REPLICA_URLS", default="", cast=decouple.Csv())
+
+
+def create_engine(url: str, prefix: str, statement_timeout: int = 0):
+    """
+    Create engine of <url> with pool and driver settings read from <prefix>_POOL_SIZE,
+    <prefix>_MAX_OVERFLOW, <prefix>_POOL_TIMEOUT (s), <prefix>_POOL_RECYCLE (s),
+    <prefix>_CONNECT_TIMEOUT (s), <prefix>_STATEMENT_TIMEOUT (ms, 0 for none) and
+    <prefix>_STATEMENT_CACHE_SIZE (prepared statements per connection) variables.
+    """
+
+    def config(name, default):
+        return decouple.config(prefix + "_" + name, default=default, cast=int)
+
+    url = make_url(url)
+    options = {}
+    if url.get_driver_name() == "asyncpg":
+        options = dict(
+            pool_size=config("POOL_SIZE", 5),
+            max_overflow=config("MAX_OVERFLOW", 10),
+            pool_timeout=config("POOL_TIMEOUT", 30),
+            pool_recycle=config("POOL_RECYCLE", 1800),
+            pool_pre_ping=True,
+            connect_args={
+                "timeout": config("CONNECT_TIMEOUT", 10),
+                "server_settings": {
+                    "statement_timeout": str(
+                        config("STATEMENT_TIMEOUT", statement_timeout)
+                    ),
+                },
+            },
+        )
+        url = url.update_query_dict(
+            {"prepared_statement_cache_size": str(config("STATEMENT_CACHE_SIZE", 100))}
+        )
+    return create_async_engine(url, echo=DEBUG, **options)
+
+
+# primary, written by importer; web API listens to importer notifications on it
+engine = create_engine(decouple.config("DATABASE_URL"), "DATABASE")
 
 # expire_on_commit=False will prevent attributes from being expired
 # after commit.
 async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+replica_engines = [
+    create_engine(url, "DATABASE_REPLICA", statement_timeout=30000)
+    for url in REPLICA_URLS
+]
+
+# read-only sessions of web API
+read_replicas = ReadReplicas(replica_engines, async_session)
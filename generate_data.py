@@ -0,0 +1,284 @@
+"""
+Fill database given by DATABASE_URL with synthetic history at production scale:
+tokens, their XOR and XSTUSD pairs, swaps with random walk prices, burns and
+buybacks spread over years up to now, then volumes, candles of last day, last
+swaps of pairs and snapshots as importer would leave them.
+SQLite tables are created, PostgreSQL database should be migrated first
+(`alembic upgrade head`), swaps are loaded there with COPY.
+Run: python generate_data.py --swaps 10000000 --years 3 --whitelist whitelist.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+from decimal import Decimal
+from time import time
+
+from sqlalchemy import insert
+
+from models import DENOM, Base, Burn, BuyBack, Pair, Swap, Token
+from processing import (
+    DAI_ID,
+    ETH_ID,
+    KUSD_ID,
+    PSWAP_ID,
+    VAL_ID,
+    XOR_ID,
+    XST_ID,
+    XSTUSD_ID,
+)
+from market import update_snapshots
+from run_node_processing import ensure_partitions, update_candles
+
+# average time between blocks, ms
+BLOCK_TIME = 6000
+DAY = 24 * 3600 * 1000
+
+KNOWN_TOKENS = {
+    "XOR": XOR_ID,
+    "VAL": VAL_ID,
+    "PSWAP": PSWAP_ID,
+    "DAI": DAI_ID,
+    "ETH": ETH_ID,
+    "XSTUSD": XSTUSD_ID,
+    "XST": XST_ID,
+    "KUSD": KUSD_ID,
+}
+# XOR is not swapped against itself, XST is traded for XSTUSD
+XSTUSD_TOKENS = ("XST",)
+# relative price change of token per swap
+VOLATILITY = 0.002
+# pool fee of swaps
+FEE = Decimal("0.003")
+# fee paid in XOR for every swap
+XOR_FEE = 7 * 10 ** 14
+
+SWAP_COLUMNS = (
+    "txid",
+    "block",
+    "timestamp",
+    "xor_fee",
+    "pair_id",
+    "from_amount",
+    "to_amount",
+    "filter_mode",
+    "swap_fee_amount",
+    "price",
+    "leg",
+)
+
+
+def make_tokens(count: int):
+    """
+    Return {symbol: id} of known tokens and synthetic ones, <count> in total.
+    """
+    tokens = {
+        symbol: int(id, 16) for symbol, id in list(KNOWN_TOKENS.items())[:count]
+    }
+    for i in range(count - len(tokens)):
+        tokens["T%i" % i] = random.getrandbits(248)
+    return tokens
+
+
+def make_pairs(tokens: dict):
+    """
+    Return [(from symbol, to symbol)] of pairs in both directions, each token is
+    traded for XOR except for ones of XSTUSD_TOKENS traded for XSTUSD.
+    """
+    pairs = []
+    for symbol in tokens:
+        quote = "XSTUSD" if symbol in XSTUSD_TOKENS and "XSTUSD" in tokens else "XOR"
+        if symbol != quote:
+            pairs += [(quote, symbol), (symbol, quote)]
+    return pairs
+
+
+def generate_swaps(pairs: dict, prices: dict, count: int, start: int, end: int):
+    """
+    Yield swap rows of SWAP_COLUMNS in time order, <count> between <start> and <end>.
+    <pairs> is {(from symbol, to symbol): pair id}, <prices> of tokens in XOR change
+    with every swap of their pairs.
+    """
+    keys = list(pairs)
+    # few pairs get most of swaps, as in production
+    weights = [1 / (rank + 1) for rank in range(len(keys))]
+    timestamp = start
+    step = (end - start) / count
+    for txid in range(1, count + 1):
+        timestamp = min(timestamp + random.expovariate(1 / step), end - 1)
+        from_symbol, to_symbol = random.choices(keys, weights)[0]
+        for symbol in (from_symbol, to_symbol):
+            if symbol != "XOR":
+                prices[symbol] *= math.exp(random.gauss(0, VOLATILITY))
+        price = Decimal(prices[from_symbol] / prices[to_symbol])
+        from_amount = Decimal(int(random.lognormvariate(3, 2) * 10 ** 18) + 1)
+        to_amount = (from_amount * price * (1 - FEE)).to_integral_value()
+        yield (
+            Decimal(txid),
+            int(timestamp - start) // BLOCK_TIME + 1,
+            int(timestamp),
+            Decimal(XOR_FEE),
+            pairs[from_symbol, to_symbol],
+            from_amount,
+            to_amount,
+            "Disabled",
+            (from_amount * FEE).to_integral_value(),
+            to_amount / from_amount,
+            0,
+        )
+
+
+async def insert_rows(session, model, columns, rows):
+    """
+    Insert <rows> of <columns> into table of <model>, with COPY in PostgreSQL.
+    """
+    if session.bind.dialect.name == "postgresql":
+        conn = await session.connection()
+        raw = await conn.get_raw_connection()
+        await raw.connection.driver_connection.copy_records_to_table(
+            model.__tablename__, records=rows, columns=columns
+        )
+    else:
+        # SQLite sums integers in 64 bits, amounts in minimal units overflow them
+        rows = [
+            [float(v) if isinstance(v, Decimal) else v for v in row] for row in rows
+        ]
+        await session.execute(insert(model), [dict(zip(columns, r)) for r in rows])
+
+
+async def generate(async_session, args):
+    random.seed(args.seed)
+    end = int(time() * 1000)
+    start = end - int(args.years * 365 * DAY)
+    tokens = make_tokens(args.tokens)
+    # prices in XOR
+    prices = {symbol: random.lognormvariate(0, 2) for symbol in tokens}
+    prices["XOR"] = 1
+    async with async_session() as session:
+        if session.bind.dialect.name == "sqlite":
+            conn = await session.connection()
+            await conn.run_sync(Base.metadata.create_all)
+        token_rows = {
+            symbol: Token(
+                asset_id=id, symbol=symbol, name="Token " + symbol, decimals=18
+            )
+            for symbol, id in tokens.items()
+        }
+        session.add_all(token_rows.values())
+        await session.flush()
+        # symbol -> key of token
+        keys = {symbol: token.id for symbol, token in token_rows.items()}
+        pairs = {}
+        for from_symbol, to_symbol in make_pairs(tokens):
+            pair = Pair(from_token_id=keys[from_symbol], to_token_id=keys[to_symbol])
+            session.add(pair)
+            await session.flush()
+            pairs[from_symbol, to_symbol] = pair.id
+        # monthly partitions in PostgreSQL, steps shorter than month visit each one
+        for timestamp in range(start, end, 28 * DAY):
+            await ensure_partitions(session, timestamp)
+        await ensure_partitions(session, end)
+        await session.commit()
+
+        last_swaps = {}
+        # amounts of last 24h by pair id, and by token key, summed up here as
+        # SQLite fails to sum amounts in minimal units
+        volumes = {pair_id: [0, 0] for pair_id in pairs.values()}
+        token_volumes = dict.fromkeys(keys.values(), 0)
+        batch = []
+        swaps = generate_swaps(pairs, prices, args.swaps, start, end)
+        for n, row in enumerate(swaps, 1):
+            batch.append(row)
+            last_swaps[row[4]] = row
+            if row[2] > end - DAY:
+                volumes[row[4]][0] += row[5]
+                volumes[row[4]][1] += row[6]
+            if len(batch) == args.batch or n == args.swaps:
+                await insert_rows(session, Swap, SWAP_COLUMNS, batch)
+                await session.commit()
+                batch = []
+                logging.info("%i swaps", n)
+
+        burned = [keys[s] for s in ("XOR", "VAL", "PSWAP") if s in keys]
+        for model in (Burn, BuyBack):
+            timestamps = sorted(random.randrange(start, end) for _ in range(args.burns))
+            for i in range(0, args.burns, args.batch):
+                rows = [
+                    (
+                        (timestamp - start) // BLOCK_TIME + 1,
+                        timestamp,
+                        random.choice(burned),
+                        Decimal(int(random.lognormvariate(3, 2) * 10 ** 18)),
+                    )
+                    for timestamp in timestamps[i:i + args.batch]
+                ]
+                for _, timestamp, token_id, amount in rows:
+                    if timestamp > end - DAY:
+                        token_volumes[token_id] += amount
+                await insert_rows(
+                    session, model, ("block", "timestamp", "token_id", "amount"), rows
+                )
+                await session.commit()
+            logging.info("%i rows of %s", args.burns, model.__tablename__)
+
+        # state importer keeps in pairs
+        for (from_symbol, to_symbol), pair_id in pairs.items():
+            pair = await session.get(Pair, pair_id)
+            xor_reserve = Decimal(random.lognormvariate(10, 2))
+            if pair_id in last_swaps:
+                pair.set_last_swap(dict(zip(SWAP_COLUMNS, last_swaps[pair_id])))
+            pair.from_token_liquidity = xor_reserve / Decimal(prices[from_symbol])
+            pair.to_token_liquidity = xor_reserve / Decimal(prices[to_symbol])
+            from_volume, to_volume = volumes[pair_id]
+            pair.from_volume = from_volume / DENOM
+            pair.to_volume = to_volume / DENOM
+            token_volumes[keys[from_symbol]] += from_volume
+            token_volumes[keys[to_symbol]] += to_volume
+        for key, volume in token_volumes.items():
+            token = await session.get(Token, key)
+            token.trade_volume = volume / DENOM
+        for timestamp in range(end - DAY, end, 60 * 1000):
+            await update_candles(session, list(pairs.values()), timestamp)
+        await update_snapshots(session, (end - start) // BLOCK_TIME + 1)
+        await session.commit()
+    if args.whitelist:
+        # web server serves pairs of whitelisted tokens only
+        with open(args.whitelist, "w") as f:
+            json.dump(
+                [
+                    {"address": "0x%064x" % id, "symbol": symbol, "decimals": 18}
+                    for symbol, id in tokens.items()
+                ],
+                f,
+            )
+    logging.info(
+        "Generated %i tokens, %i pairs, %i swaps", len(tokens), len(pairs), args.swaps
+    )
+
+
+if __name__ == "__main__":
+    from db import async_session
+
+    parser = argparse.ArgumentParser(
+        description="Fill DB with synthetic tokens, pairs, swaps, burns and buybacks."
+    )
+    parser.add_argument("--tokens", type=int, default=50, help="number of tokens")
+    parser.add_argument("--swaps", type=int, default=10 ** 7, help="number of swaps")
+    parser.add_argument(
+        "--burns", type=int, default=10 ** 5, help="number of burns and of buybacks"
+    )
+    parser.add_argument("--years", type=float, default=3, help="history length")
+    parser.add_argument(
+        "--batch", type=int, default=10000, help="rows inserted at once"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument(
+        "--whitelist", help="save all tokens as whitelist for WHITELIST_PATH of web"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)s %(message)s", level=logging.INFO
+    )
+    asyncio.run(generate(async_session, args))
@@ -0,0 +1,123 @@
+"""
+Load test of running web API: requests endpoints at given concurrency for given
+time, then reports throughput and latency percentiles of each endpoint.
+Fill DB with generate_data.py first for production-like data.
+Run: python loadtest.py --url http://localhost:8000 --concurrency 50 --duration 30
+"""
+import argparse
+import asyncio
+import itertools
+import random
+from time import perf_counter
+
+import httpx
+import numpy as np
+
+GRAPH_QUERY = """{
+  swapsConnection(first: 20) {
+    edges { node { hash block timestamp fromAmount toAmount
+      pair { fromToken { symbol } toToken { symbol } } } }
+    pageInfo { endCursor hasNextPage }
+  }
+}"""
+
+ENDPOINTS = ("pairs", "tickers", "pair", "graph")
+
+
+def make_request(endpoint: str, pairs: list):
+    """
+    Return (method, path, kwargs) of request to <endpoint>.
+    """
+    if endpoint == "pairs":
+        return "GET", "/pairs/", {}
+    if endpoint == "tickers":
+        return "GET", "/tickers/", {}
+    if endpoint == "pair":
+        return "GET", "/pairs/%s/" % random.choice(pairs), {}
+    return "POST", "/graph", {"json": {"query": GRAPH_QUERY}}
+
+
+async def worker(client, requests, pairs, deadline, results):
+    while perf_counter() < deadline:
+        endpoint = next(requests)
+        method, path, kwargs = make_request(endpoint, pairs)
+        start = perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        results[endpoint].append((perf_counter() - start, ok))
+
+
+def report(results, elapsed: float):
+    print(
+        "%-10s %8s %8s %7s %9s %9s %9s"
+        % ("endpoint", "requests", "req/s", "errors", "p50 ms", "p95 ms", "p99 ms")
+    )
+    for endpoint, samples in results.items():
+        if not samples:
+            continue
+        latencies = np.array([latency for latency, _ in samples]) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(
+            "%-10s %8i %8.1f %7i %9.1f %9.1f %9.1f"
+            % (
+                endpoint,
+                len(samples),
+                len(samples) / elapsed,
+                sum(not ok for _, ok in samples),
+                p50,
+                p95,
+                p99,
+            )
+        )
+
+
+async def main(args):
+    endpoints = args.endpoints.split(",")
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        raise SystemExit("Unknown endpoints: " + ", ".join(sorted(unknown)))
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.url, limits=limits, timeout=args.timeout
+    ) as client:
+        # symbols of existing pairs for /pairs/{base}-{quote}/
+        pairs = [
+            "%s-%s" % (p["base_symbol"], p["quote_symbol"])
+            for p in (await client.get("/pairs/")).json().values()
+        ]
+        if not pairs and "pair" in endpoints:
+            raise SystemExit("No pairs to request")
+        # workers take endpoints in turn
+        requests = itertools.cycle(endpoints)
+        results = {endpoint: [] for endpoint in endpoints}
+        start = perf_counter()
+        await asyncio.gather(
+            *(
+                worker(client, requests, pairs, start + args.duration, results)
+                for _ in range(args.concurrency)
+            )
+        )
+        report(results, perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test of web API.")
+    parser.add_argument("--url", default="http://localhost:8000", help="API URL")
+    parser.add_argument(
+        "--concurrency", "-c", type=int, default=50, help="requests in flight"
+    )
+    parser.add_argument(
+        "--duration", "-d", type=float, default=30, help="test time, seconds"
+    )
+    parser.add_argument(
+        "--endpoints",
+        default=",".join(ENDPOINTS),
+        help="comma-separated endpoints to request: " + ", ".join(ENDPOINTS),
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30, help="request timeout, seconds"
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,243 @@
+"""
+Market data shared by web API and importer: pairs and tickers replies
+and their snapshots precomputed by importer.
+"""
+import math
+from decimal import Decimal
+from time import time
+
+import orjson
+from sqlalchemy import text
+
+import queries
+from models import Snapshot
+from price_engine import PriceEngine
+from processing import KUSD_ID, VXOR_ID, XOR_ID, XST_ID, XSTUSD_ID
+
+XOR_ID_INT = int(XOR_ID, 16)
+XSTUSD_ID_INT = int(XSTUSD_ID, 16)
+KUSD_ID_INT = int(KUSD_ID, 16)
+VXOR_ID_INT = int(VXOR_ID, 16)
+XST_ID_INT = int(XST_ID, 16)
+
+# PostgreSQL NOTIFY channel of importer commits
+IMPORT_CHANNEL = "sora_import"
+
+# routes of tokens to stable tokens, shared by all prices in USD
+price_engine = PriceEngine()
+
+
+class FormattedFloat(float):
+    def __repr__(self):
+        # remove redundant 0 after formatting and then remove . if it is integer number
+        return '{:.18f}'.format(self).rstrip('0').rstrip('.')
+
+
+def format_number(value):
+    """
+    orjson hook serializing FormattedFloat and Decimal with up to 18 decimal digits.
+    """
+    if isinstance(value, Decimal):
+        finite = value.is_finite()
+    elif isinstance(value, float):
+        finite = math.isfinite(value)
+    else:
+        raise TypeError("Type is not JSON serializable: %s" % type(value).__name__)
+    if not finite:
+        # same as orjson does for plain floats
+        return None
+    return orjson.Fragment('{:.18f}'.format(value).rstrip('0').rstrip('.'))
+
+
+def render_json(content) -> bytes:
+    """
+    Serialize API reply, floats formatted with up to 18 decimal digits.
+    """
+    return orjson.dumps(content, default=format_number)
+async def get_last_prices_in_dai(session, token_ids: list):
+    """
+    Return {token asset id: price in USD (DAI or other stable token), 0 if unknown}.
+    """
+    await price_engine.refresh(session)
+    return price_engine.prices(token_ids)
+
+
+async def get_pairs(session):
+    """
+    Return information on pairs, reply of /pairs/ endpoint.
+    """
+    pairs = {}
+    # fetch all pairs info, price of last swap is stored in pair
+    for p in await session.scalars(queries.pairs_with_tokens()):
+        last_price = p.last_price
+        from_asset_id = p.from_token.asset_id
+        # there are separate pairs for selling and buying XOR
+        # need to sum them to calculate total volumes
+        if from_asset_id == XOR_ID_INT or from_asset_id == XSTUSD_ID_INT \
+              or from_asset_id == KUSD_ID_INT or from_asset_id == VXOR_ID_INT:
+            # <p> contains XOR->XXX swaps
+            base = p.to_token
+            base_volume = p.to_volume
+            quote = p.from_token
+            quote_volume = p.from_volume
+            quote_price = p.quote_price
+            if quote_price:
+                quote_price = 1 / quote_price
+            if last_price:
+                # reverse price
+                last_price = 1 / last_price
+        else:
+            base = p.from_token
+            base_volume = p.from_volume
+            quote = p.to_token
+            quote_volume = p.to_volume
+            quote_price = p.quote_price
+        # quote is always XOR
+        id = base.hash + "_" + quote.hash
+        if id in pairs:
+            # sum up buying and sellling volumes
+            if base_volume:
+                pairs[id]["base_volume"] += FormattedFloat(base_volume)
+            if quote_volume:
+                pairs[id]["quote_volume"] += FormattedFloat(quote_volume)
+        elif (quote_price is None and last_price == 0) or (last_price is None and quote_price == 0) or \
+            (last_price is None and quote_price is None):
+            continue
+        else:
+            pairs[id] = {
+                "base_id": base.hash,
+                "base_name": base.name,
+                "base_symbol": base.symbol,
+                "quote_id": quote.hash,
+                "quote_name": quote.name,
+                "quote_symbol": quote.symbol,
+                "last_price": FormattedFloat(quote_price or last_price),
+                "base_volume": FormattedFloat(base_volume or 0),
+                "quote_volume": FormattedFloat(quote_volume or 0),
+            }
+    return pairs
+
+
+async def get_tickers(session):
+    """
+    Return information on tickers(pairs), reply of /tickers/ endpoint.
+
+    Pools just use token_id -> token_id as identifier, so pool_id not included
+    """
+    pairs = {}
+    last_24h = (time() - 24 * 3600) * 1000
+    prices_in_dai = await get_last_prices_in_dai(session, [XOR_ID_INT, XSTUSD_ID_INT, KUSD_ID_INT, VXOR_ID_INT, XST_ID_INT])
+
+    # price range of each pair from its 5 minute candles of last 24h
+    request_result = await session.execute(queries.tickers(int(last_24h)))
+
+    # fetch all pairs info, price of last swap is stored in pair
+    for p, high_price, low_price in request_result:
+        last_price = p.last_price
+        from_asset_id = p.from_token.asset_id
+        to_asset_id = p.to_token.asset_id
+        # there are separate pairs for selling and buying XOR
+        # need to sum them to calculate total volumes
+        if from_asset_id == XOR_ID_INT or from_asset_id == XSTUSD_ID_INT \
+              or from_asset_id == KUSD_ID_INT or from_asset_id == VXOR_ID_INT \
+                or from_asset_id == XST_ID_INT:
+            # <p> contains XOR->XXX swaps
+            base = p.to_token
+            base_volume = p.to_volume
+            quote = p.from_token
+            quote_volume = p.from_volume
+            quote_price = p.quote_price
+            if quote_price:
+                quote_price = 1 / quote_price
+            # reverse price
+            if last_price:
+                last_price = 1 / last_price
+            liquidity_in_dai = ((p.from_token_liquidity or 0) + (p.to_token_liquidity or 0) * (quote_price or last_price or 0))\
+                * prices_in_dai[from_asset_id]
+            if low_price or high_price:
+                high_price, low_price = (1 / low_price if low_price else None, 
+                                         1 / high_price if high_price else None)
+        elif to_asset_id == XOR_ID_INT or to_asset_id == XSTUSD_ID_INT \
+              or to_asset_id == KUSD_ID_INT or to_asset_id == VXOR_ID_INT \
+                or to_asset_id == XST_ID_INT:
+            base = p.from_token
+            base_volume = p.from_volume
+            quote = p.to_token
+            quote_volume = p.to_volume
+            quote_price = p.quote_price
+            liquidity_in_dai = ((p.from_token_liquidity or 0) * (quote_price or last_price or 0) + (p.to_token_liquidity or 0))\
+                * prices_in_dai[to_asset_id]
+        else:
+            continue
+
+        id = base.hash + "_" + quote.hash
+        rev_id = quote.hash + "_" + base.hash
+
+        if rev_id in pairs:
+            liquidity_in_dai = pairs[rev_id]["liquidity_in_usd"] = max(FormattedFloat(liquidity_in_dai), pairs[rev_id]["liquidity_in_usd"])
+            quote_volume = pairs[rev_id]["base_volume"] = pairs[rev_id]["base_volume"] + FormattedFloat(quote_volume or 0)
+            base_volume = pairs[rev_id]["target_volume"] = pairs[rev_id]["target_volume"] + FormattedFloat(base_volume or 0)
+        if id in pairs:
+            # sum up buying and sellling volumes
+            if base_volume:
+                pairs[id]["base_volume"] += FormattedFloat(base_volume or 0)
+            if quote_volume:
+                pairs[id]["target_volume"] += FormattedFloat(quote_volume or 0)
+        elif (quote_price is None and last_price == 0) or (last_price is None and quote_price == 0) or \
+            (last_price is None and quote_price is None):
+            continue
+        else:
+            pairs[id] = {
+                "ticker_id": id,
+                "base_currency": base.hash,
+                "base_name": base.name,
+                "base_symbol": base.symbol, 
+                "target_currency": quote.hash,
+                "target_name": quote.name,
+                "target_symbol": quote.symbol,
+                "last_price": FormattedFloat(last_price or quote_price), 
+                "base_volume": FormattedFloat(base_volume or 0),
+                "target_volume": FormattedFloat(quote_volume or 0),
+                "liquidity_in_usd": FormattedFloat(liquidity_in_dai),
+                "high": FormattedFloat(high_price or 0),
+                "low": FormattedFloat(low_price or 0),
+            }
+    return list(pairs.values())
+
+
+async def update_snapshots(session, block: int):
+    """
+    Compute /pairs/ and /tickers/ replies as of <block> and store them
+    to be served by web API as is. Return (block, updated) version of snapshots
+    and dict of their bodies by name. Session not commited.
+    """
+    updated = int(time() * 1000)
+    bodies = {}
+    for name, data in (
+        ("pairs", await get_pairs(session)),
+        ("tickers", await get_tickers(session)),
+    ):
+        bodies[name] = render_json(data)
+        await session.merge(
+            Snapshot(name=name, block=block, updated=updated, data=bodies[name])
+        )
+    return (block, updated), bodies
+
+
+async def notify_import(session, block: int, pair_ids=None, version=None):
+    """
+    Notify web workers listening on IMPORT_CHANNEL about data imported up to <block>:
+    swaps of <pair_ids> or new snapshots of <version>. Delivered by PostgreSQL on commit,
+    no-op on other databases. Session not commited.
+    """
+    if session.bind.dialect.name != "postgresql":
+        return
+    payload = {"block": block}
+    if pair_ids is not None:
+        payload["pairs"] = sorted(pair_ids)
+    if version is not None:
+        payload["version"] = list(version)
+    await session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": IMPORT_CHANNEL, "payload": orjson.dumps(payload).decode()},
+    )
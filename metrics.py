@@ -0,0 +1,192 @@
+"""
+Request latency and SQL statement histograms of web API in Prometheus text format,
+SQL statements are tagged by route of request executing them.
+Metrics are kept per process.
+"""
+import logging
+from bisect import bisect_left
+from contextvars import ContextVar
+from time import perf_counter
+
+import decouple
+from sqlalchemy import event
+from starlette.routing import Match
+
+# statements slower than that are logged with parameters, seconds
+SLOW_QUERY_THRESHOLD = decouple.config(
+    "SLOW_QUERY_THRESHOLD", default=0.5, cast=float
+)
+
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+# route template of request being handled
+current_route = ContextVar("current_route", default="background")
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    """
+    Prometheus histogram with "route" label.
+    """
+
+    def __init__(self, name: str, help: str, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # route -> [count of each bucket and +Inf (not cumulative), sum]
+        self.series = {}
+
+    def observe(self, route: str, value: float):
+        series = self.series.get(route)
+        if series is None:
+            series = self.series[route] = [0] * (len(self.buckets) + 1) + [0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> str:
+        lines = [
+            "# HELP %s %s" % (self.name, self.help),
+            "# TYPE %s histogram" % self.name,
+        ]
+        for route, series in sorted(self.series.items()):
+            label = 'route="%s"' % escape(route)
+            count = 0
+            for bound, bucket in zip(self.buckets + ("+Inf",), series):
+                count += bucket
+                lines.append(
+                    '%s_bucket{%s,le="%s"} %i' % (self.name, label, bound, count)
+                )
+            lines.append("%s_sum{%s} %r" % (self.name, label, series[-1]))
+            lines.append("%s_count{%s} %i" % (self.name, label, count))
+        return "\n".join(lines) + "\n"
+
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency by route.", DURATION_BUCKETS
+)
+query_duration = Histogram(
+    "sql_query_duration_seconds",
+    "SQL statement execution time by route.",
+    DURATION_BUCKETS,
+)
+query_rows = Histogram(
+    "sql_query_rows",
+    "Rows returned by SQL statement, or affected by one returning none.",
+    ROWS_BUCKETS,
+)
+
+
+def render_metrics() -> bytes:
+    return "".join(
+        histogram.render()
+        for histogram in (request_duration, query_duration, query_rows)
+    ).encode()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing requests by route template, e.g. /pairs/{base}-{quote}/.
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+
+    def match(self, scope) -> str:
+        for route in self.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        route = self.match(scope)
+        token = current_route.set(route)
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_duration.observe(route, perf_counter() - start)
+            current_route.reset(token)
+
+
+class CountingCursor:
+    """
+    DB-API cursor proxy counting rows fetched from it,
+    their count is observed when cursor is closed.
+    """
+
+    def __init__(self, cursor, route: str):
+        self.cursor = cursor
+        self.route = route
+        self.count = 0
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self.count += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self.cursor.fetchmany(*args)
+        self.count += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.count += len(rows)
+        return rows
+
+    def close(self):
+        if self.route is not None:
+            query_rows.observe(self.route, self.count)
+            self.route = None
+        self.cursor.close()
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info["query_start"].pop()
+    route = current_route.get()
+    query_duration.observe(route, elapsed)
+    if cursor.description is not None:
+        # drivers report -1 as count of selected rows, e.g. asyncpg, so rows are
+        # counted as result fetches them from cursor of execution context
+        if context is not None:
+            context.cursor = CountingCursor(cursor, route)
+    elif cursor.rowcount >= 0:
+        query_rows.observe(route, cursor.rowcount)
+    if elapsed >= SLOW_QUERY_THRESHOLD:
+        logging.warning(
+            "Slow query (%.3f s, %s): %s %r", elapsed, route, statement, parameters
+        )
+
+
+def handle_error(context):
+    # failed statement is not timed
+    conn = context.connection
+    if conn is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+def instrument(target):
+    """
+    Time SQL statements of engine or Engine class <target>.
+    """
+    event.listen(target, "before_cursor_execute", before_cursor_execute)
+    event.listen(target, "after_cursor_execute", after_cursor_execute)
+    event.listen(target, "handle_error", handle_error)
@@ -1,16 +1,62 @@
-from sqlalchemy import BigInteger, Column, ForeignKey, Index, Integer, Numeric, String
+from decimal import Decimal
+
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    Numeric,
+    PrimaryKeyConstraint,
+    String,
+    UniqueConstraint,
+)
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import backref, declarative_base, relationship
+from sqlalchemy.schema import CreateColumn
 
 Base = declarative_base()
 
+# token amounts are stored in minimal units, all tokens have 18 decimals
+DENOM = Decimal(10 ** 18)
+
+
+def generated_id(table):
+    """
+    Return id column of <table> generated by DB within composite primary key
+    (id, timestamp), None if there is no such one.
+    """
+    columns = table.primary_key.columns
+    generated = [c for c in columns if c.autoincrement is True]
+    return generated[0] if generated and len(columns) > 1 else None
+
+
+# SQLite generates ids only of single integer primary key, so tables keyed by
+# generated id and timestamp (partition key in PostgreSQL) are keyed by id there
+@compiles(CreateColumn, "sqlite")
+def compile_sqlite_column(create, compiler, **kw):
+    column = create.element
+    if column is generated_id(column.table):
+        return compiler.preparer.format_column(column) + " INTEGER NOT NULL"
+    return compiler.visit_create_column(create, **kw)
+
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def compile_sqlite_primary_key(constraint, compiler, **kw):
+    column = generated_id(constraint.table)
+    if column is not None:
+        return "PRIMARY KEY (%s)" % compiler.preparer.format_column(column)
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
 
 class Token(Base):
     __tablename__ = "token"
 
-    # Original scheme don't work locally. Keep it here to make local development easier.
-    # pk = Column(Integer, primary_key=True)
-    # id = Column(Numeric(80), nullable=False, unique=True)
-    id = Column(Numeric(80), primary_key=True)
+    # tables reference tokens by small integer keys, see token_registry.py
+    id = Column(Integer, primary_key=True)
+    # 32-byte asset id on chain
+    asset_id = Column(Numeric(80), nullable=False, unique=True, index=True)
     symbol = Column(String(8), nullable=False)
     name = Column(String(128), nullable=False)
     decimals = Column(Integer, nullable=False)
@@ -18,7 +64,7 @@ class Token(Base):
 
     @property
     def hash(self):
-        return "0x%064x" % int(self.id)
+        return "0x%064x" % int(self.asset_id)
 
 
 class Pair(Base):
@@ -41,21 +87,76 @@ class Pair(Base):
     from_token_liquidity = Column(Numeric())
     to_token_liquidity = Column(Numeric())
     quote_price = Column(Numeric(), nullable=True)
+    # last swap of the pair, maintained by importer
+    last_price = Column(Numeric(), nullable=True)
+    last_block = Column(Integer, nullable=True)
+    last_txid = Column(Numeric(precision=80), nullable=True)
+    last_timestamp = Column(BigInteger, nullable=True)
+
+    @property
+    def last_hash(self):
+        if self.last_txid is not None:
+            return "0x%064x" % int(self.last_txid)
+
+    def set_last_swap(self, swap: dict):
+        """
+        Remember <swap> (row of swap table) as last one if it is not older than current.
+        """
+        if self.last_timestamp is None or swap["timestamp"] >= self.last_timestamp:
+            self.last_price = get_price(swap["from_amount"], swap["to_amount"])
+            self.last_block = swap["block"]
+            self.last_txid = swap["txid"]
+            self.last_timestamp = swap["timestamp"]
+
+
+def get_price(from_amount, to_amount):
+    """
+    Return amount of to_token received for one from_token.
+    """
+    if from_amount:
+        return Decimal(to_amount) / Decimal(from_amount)
+    return None
+
+
+def swap_price(context):
+    """
+    Default for Swap.price: amount of to_token received for one from_token.
+    """
+    params = context.get_current_parameters()
+    return get_price(params["from_amount"], params["to_amount"])
 
 
 class Swap(Base):
     __tablename__ = "swap"
+    # natural key of a swap: multi-hop swaps are stored as one row per leg.
+    # In PostgreSQL swap, burn and buyback are partitioned by month of timestamp
+    # (see alembic migrations), so their unique keys include timestamp.
+    __table_args__ = (
+        UniqueConstraint(
+            "block",
+            "txid",
+            "pair_id",
+            "leg",
+            "timestamp",
+            name="uq_swap_block_txid_pair_leg",
+        ),
+    )
 
-    id = Column(Integer, primary_key=True)
+    # primary key includes partition key, id alone is generated
+    id = Column(Integer, primary_key=True, autoincrement=True)
     txid = Column(Numeric(80))
     block = Column(Integer, nullable=False)
-    timestamp = Column(BigInteger, index=True, nullable=False)
+    timestamp = Column(BigInteger, primary_key=True, index=True)
     xor_fee = Column(Numeric(40), nullable=False)
     pair_id = Column(ForeignKey("pair.id"), nullable=False)
     from_amount = Column(Numeric(), nullable=False)
     to_amount = Column(Numeric(), nullable=False)
     filter_mode = Column(String(32), nullable=False)
     swap_fee_amount = Column(Numeric())
+    # to_amount / from_amount, stored to avoid division when querying prices
+    price = Column(Numeric(), default=swap_price)
+    # position of the swap within multi-hop route of the transaction
+    leg = Column(Integer, nullable=False, default=0, server_default="0")
     pair = relationship(
         Pair, backref=backref("swaps", uselist=True, cascade="delete,all")
     )
@@ -65,14 +166,90 @@ class Swap(Base):
         return "0x%064x" % int(self.txid)
 
 
+# candle intervals in seconds, each candle is aggregated from candles of previous interval
+CANDLE_INTERVALS = {"1m": 60, "5m": 300, "1h": 3600, "1d": 86400}
+
+
+class Candle(Base):
+    """
+    OHLCV of pair's swaps during <interval> seconds starting at <timestamp>.
+    """
+
+    __tablename__ = "candle"
+
+    pair_id = Column(ForeignKey("pair.id"), primary_key=True)
+    interval = Column(Integer, primary_key=True)
+    timestamp = Column(BigInteger, primary_key=True)
+    open = Column(Numeric(), nullable=False)
+    high = Column(Numeric(), nullable=False)
+    low = Column(Numeric(), nullable=False)
+    close = Column(Numeric(), nullable=False)
+    from_volume = Column(Numeric(), nullable=False)
+    to_volume = Column(Numeric(), nullable=False)
+    swaps = Column(Integer, nullable=False)
+    # timestamps of first and last swaps, to merge candles of both pair directions
+    open_timestamp = Column(BigInteger, nullable=False)
+    close_timestamp = Column(BigInteger, nullable=False)
+    pair = relationship(
+        Pair, backref=backref("candles", uselist=True, cascade="delete,all")
+    )
+
+    @staticmethod
+    def merge(candles):
+        """
+        Merge (open, high, low, close, from_volume, to_volume, swaps,
+        open_timestamp, close_timestamp) tuples into dict of Candle fields.
+        """
+        # on ties the first candle opens and the last one closes
+        first = min(candles, key=lambda c: c[7])
+        last = max(reversed(candles), key=lambda c: c[8])
+        return dict(
+            open=first[0],
+            high=max(c[1] for c in candles),
+            low=min(c[2] for c in candles),
+            close=last[3],
+            from_volume=sum(c[4] for c in candles),
+            to_volume=sum(c[5] for c in candles),
+            swaps=sum(c[6] for c in candles),
+            open_timestamp=first[7],
+            close_timestamp=last[8],
+        )
+
+
+class Snapshot(Base):
+    """
+    API reply precomputed by importer as of <block>, served by web API as is.
+    """
+
+    __tablename__ = "snapshot"
+
+    name = Column(String(32), primary_key=True)
+    block = Column(Integer, nullable=False)
+    updated = Column(BigInteger, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+
+
 class Burn(Base):
     __tablename__ = "burn"
+    # natural key of a burn: event of block it is derived from,
+    # it serves lookups by block too
+    __table_args__ = (
+        UniqueConstraint(
+            "block",
+            "token_id",
+            "event_index",
+            "timestamp",
+            name="uq_burn_block_token_event",
+        ),
+    )
 
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     block = Column(Integer, nullable=False)
-    timestamp = Column(BigInteger, index=True, nullable=False)
+    timestamp = Column(BigInteger, primary_key=True, index=True)
     token_id = Column(ForeignKey("token.id"), nullable=False)
     amount = Column(Numeric(), nullable=False)
+    # index of the event in block, NULL for rows imported before it was recorded
+    event_index = Column(Integer)
     token = relationship(
         Token, backref=backref("burns", uselist=True, cascade="delete,all")
     )
@@ -80,15 +257,71 @@ class Burn(Base):
 
 class BuyBack(Base):
     __tablename__ = "buyback"
+    __table_args__ = (
+        UniqueConstraint(
+            "block",
+            "token_id",
+            "event_index",
+            "timestamp",
+            name="uq_buyback_block_token_event",
+        ),
+    )
 
-    id = Column(Integer, primary_key=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     block = Column(Integer, nullable=False)
-    timestamp = Column(BigInteger, index=True, nullable=False)
+    timestamp = Column(BigInteger, primary_key=True, index=True)
     token_id = Column(ForeignKey("token.id"), nullable=False)
     amount = Column(Numeric(), nullable=False)
+    event_index = Column(Integer)
     token = relationship(
         Token, backref=backref("buybacks", uselist=True, cascade="delete,all")
     )
 
 
-Index("idx_swap_pair_timestamp_desc", Swap.pair_id, Swap.timestamp.desc())
+# covering index, last price and price range lookups are index-only scans
+Index(
+    "idx_swap_pair_timestamp_desc",
+    Swap.pair_id,
+    Swap.timestamp.desc(),
+    Swap.id.desc(),
+    postgresql_include=["price", "from_amount", "to_amount", "block", "txid"],
+)
+
+# price as of block lookups
+Index(
+    "idx_swap_pair_block_desc",
+    Swap.pair_id,
+    Swap.block.desc(),
+    Swap.id.desc(),
+    postgresql_include=["price", "timestamp"],
+)
+
+# price ranges of all pairs over last candles of interval are index-only scans
+Index(
+    "idx_candle_interval_timestamp",
+    Candle.interval,
+    Candle.timestamp,
+    postgresql_include=["pair_id", "high", "low"],
+)
+
+# rows are appended in block and timestamp order, so block ranges of these tiny
+# indexes select few pages of large tables; point lookups of swaps by block use
+# uq_swap_block_txid_pair_leg
+Index(
+    "brin_swap_block_timestamp",
+    Swap.block,
+    Swap.timestamp,
+    postgresql_using="brin",
+)
+Index(
+    "brin_burn_block_timestamp",
+    Burn.block,
+    Burn.timestamp,
+    postgresql_using="brin",
+)
+Index(
+    "brin_buyback_block_timestamp",
+    BuyBack.block,
+    BuyBack.timestamp,
+    postgresql_using="brin",
+)
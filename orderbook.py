@@ -0,0 +1,43 @@
+"""
+Synthetic order book of XYK pool: price levels a constant-product pool with given
+reserves would fill, as if they were limit orders.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+# fee of XYK pool swaps
+XYK_FEE = 0.003
+# relative price step between levels of order book
+PRICE_STEP = 0.005
+# max levels on each side of order book
+MAX_LEVELS = 500
+
+
+@lru_cache(maxsize=4096)
+def xyk_order_book(base_reserve: float, target_reserve: float, levels: int):
+    """
+    Return (bids, asks) of pool with <base_reserve> and <target_reserve>, lists of
+    [price, base amount] with <levels> levels each, best price first.
+    Price is in target tokens for one base token and includes pool fee.
+    Cached by reserves, so it is computed once per reserves snapshot.
+    """
+    if base_reserve <= 0 or target_reserve <= 0 or levels <= 0:
+        return [], []
+    k = base_reserve * target_reserve
+    spot = target_reserve / base_reserve
+    steps = np.arange(levels + 1) * PRICE_STEP
+    # base reserve when marginal pool price reaches price p: x = sqrt(k / p)
+    # asks: pool sells base until its price rises by i steps
+    ask_reserves = np.sqrt(k / (spot * (1 + steps)))
+    ask_amounts = ask_reserves[:-1] - ask_reserves[1:]
+    ask_prices = spot * (1 + steps[1:]) / (1 - XYK_FEE)
+    # bids: pool buys base until its price falls by i steps
+    bid_steps = steps[steps < 1]
+    bid_reserves = np.sqrt(k / (spot * (1 - bid_steps)))
+    bid_amounts = bid_reserves[1:] - bid_reserves[:-1]
+    bid_prices = spot * (1 - bid_steps[1:]) * (1 - XYK_FEE)
+    return (
+        np.column_stack((bid_prices, bid_amounts)).tolist(),
+        np.column_stack((ask_prices, ask_amounts)).tolist(),
+    )
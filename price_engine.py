@@ -0,0 +1,125 @@
+"""
+USD prices of tokens resolved over graph of pairs. Each token is priced through its
+widest route to a stable token: the route whose least liquid pool holds the most
+value. Routes are recomputed only when pairs or their liquidity change, prices are
+evaluated along them with current pair prices.
+"""
+import heapq
+from collections import defaultdict
+from decimal import Decimal
+
+import queries
+from processing import DAI_ID, KUSD_ID, XSTUSD_ID
+from token_registry import token_registry
+
+# tokens priced at 1 USD, routes end at them
+STABLE_TOKENS = (int(DAI_ID, 16), int(XSTUSD_ID, 16), int(KUSD_ID, 16))
+
+INFINITY = Decimal("Infinity")
+
+
+class PriceEngine:
+    """
+    Routes of tokens to stable tokens and prices of pairs they go through.
+    """
+
+    def __init__(self):
+        # pair id -> price of its last swap, to tokens for one from token
+        self.rates = {}
+        # pairs and their liquidity routes were found for
+        self.graph = None
+        # token id -> [(pair id, inverted)] hops from token to stable token
+        self.routes = {}
+
+    async def refresh(self, session):
+        """
+        Reload prices and liquidity of pairs, find routes again if they changed.
+        """
+        rows = (await session.execute(queries.priced_pairs())).all()
+        # routes are found over asset ids, by which stable tokens are known
+        self.update(
+            [
+                (
+                    id,
+                    await token_registry.asset_id(session, from_key),
+                    await token_registry.asset_id(session, to_key),
+                    *rest,
+                )
+                for id, from_key, to_key, *rest in rows
+            ]
+        )
+
+    def update(self, rows):
+        """
+        Take (id, from token asset id, to token asset id, quote price, last price,
+        from token liquidity, to token liquidity) rows of pairs.
+        """
+        self.rates = {row[0]: row[3] or row[4] for row in rows if row[3] or row[4]}
+        graph = frozenset(
+            (id, int(from_id), int(to_id), from_liquidity or 0, to_liquidity or 0)
+            for id, from_id, to_id, _, _, from_liquidity, to_liquidity in rows
+            if id in self.rates
+        )
+        if graph != self.graph:
+            self.routes = find_routes(graph, self.rates)
+            self.graph = graph
+
+    def price(self, token_id) -> Decimal:
+        """
+        Return price of token in USD along its route, 0 if there is none.
+        """
+        route = self.routes.get(int(token_id))
+        if route is None:
+            return Decimal(0)
+        price = Decimal(1)
+        for pair_id, inverted in route:
+            rate = self.rates[pair_id]
+            price = price / rate if inverted else price * rate
+        return price
+
+    def prices(self, token_ids=None) -> dict:
+        """
+        Return {token id: USD price} of <token_ids> or all tokens with routes.
+        """
+        if token_ids is None:
+            token_ids = self.routes
+        return {token_id: self.price(token_id) for token_id in token_ids}
+
+
+def find_routes(graph, rates: dict) -> dict:
+    """
+    Return {token id: [(pair id, inverted)]} widest routes to stable tokens over
+    <graph> of (pair id, from token id, to token id, from token liquidity, to token
+    liquidity). Liquidity of pool is valued in USD by the token already priced.
+    """
+    # token -> [(neighbour, pair id, inverted, liquidity of token in pair)],
+    # 1 from token = rate to tokens, so neighbour of from token is inverted
+    edges = defaultdict(list)
+    for pair_id, from_id, to_id, from_liquidity, to_liquidity in graph:
+        edges[to_id].append((from_id, pair_id, False, to_liquidity))
+        edges[from_id].append((to_id, pair_id, True, from_liquidity))
+    usd = {token_id: Decimal(1) for token_id in STABLE_TOKENS}
+    width = {token_id: INFINITY for token_id in STABLE_TOKENS}
+    routes = {token_id: [] for token_id in STABLE_TOKENS}
+    heap = [(-INFINITY, token_id) for token_id in STABLE_TOKENS]
+    done = set()
+    # Dijkstra maximizing liquidity of least liquid pool of route
+    while heap:
+        _, token_id = heapq.heappop(heap)
+        if token_id in done:
+            continue
+        done.add(token_id)
+        for neighbour, pair_id, inverted, liquidity in edges[token_id]:
+            if neighbour in done:
+                continue
+            candidate = min(width[token_id], liquidity * usd[token_id])
+            if candidate > width.get(neighbour, -1):
+                rate = rates[pair_id]
+                width[neighbour] = candidate
+                if inverted:
+                    usd[neighbour] = usd[token_id] / rate
+                else:
+                    usd[neighbour] = usd[token_id] * rate
+                routes[neighbour] = [(pair_id, inverted)] + routes[token_id]
+                heapq.heappush(heap, (-candidate, neighbour))
+    return routes
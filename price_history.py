@@ -0,0 +1,168 @@
+"""
+Point-in-time prices of pairs: last swap price as of block or timestamp.
+Single lookups are index scans, batches are answered by binary search in sorted
+arrays of swaps kept in memory for recently queried pairs.
+"""
+import asyncio
+from collections import OrderedDict
+
+import numpy as np
+
+import queries
+
+# number of pairs whose swaps are kept in memory
+HOT_PAIRS = 32
+# number of swaps read at once when loading them
+SWAPS_CHUNK = 10000
+
+
+def swap_price(pair_id, price, base_pair_id: int) -> float:
+    """
+    Return price of swap in quote tokens for one base token, nan if unknown.
+    """
+    if not price:
+        return float("nan")
+    return float(price) if pair_id == base_pair_id else 1 / float(price)
+
+
+async def lookup_price(
+    session, pair_ids: list, base_pair_id: int, column: str, value: int
+):
+    """
+    Return (price, block, timestamp) of last swap of <pair_ids> with <column> ("block"
+    or "timestamp") <= <value>, one index scan per pair, or None if there is none.
+    """
+    last = key = None
+    for pair_id in pair_ids:
+        row = (
+            await session.execute(queries.last_swap_price(pair_id, column, value))
+        ).first()
+        # of swaps of both pairs in the same block the last imported one is used
+        if row and (key is None or tuple(row[:3]) > key):
+            key = tuple(row[:3])
+            last = (swap_price(pair_id, row[3], base_pair_id), row[0], row[1])
+    return last
+
+
+class PriceSeries:
+    """
+    Blocks, timestamps and prices of swaps of pair and its reverse in timestamp order,
+    prices in quote tokens for one base token. Only swaps since <start> ms are loaded,
+    it is moved back when earlier ones are needed.
+    """
+
+    def __init__(self, pair_ids: list, base_pair_id: int):
+        self.pair_ids = pair_ids
+        self.base_pair_id = base_pair_id
+        self.start = None
+        self.blocks = np.empty(0, dtype=np.int64)
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.prices = np.empty(0, dtype=np.float64)
+        self.lock = asyncio.Lock()
+
+    def arrays(self):
+        """
+        Return (blocks, timestamps, prices) arrays.
+        """
+        return self.blocks, self.timestamps, self.prices
+
+    def covers(self, column: str, value: int) -> bool:
+        """
+        Whether last swap with <column> <= <value> is loaded, if there is one.
+        """
+        loaded = getattr(self, column + "s")
+        return self.start == 0 or bool(len(loaded)) and loaded[0] <= value
+
+    async def load(self, session, from_: int, to: int = None):
+        """
+        Return (blocks, timestamps, prices) arrays of swaps in [<from_>, <to>) ms,
+        read from server-side cursor in chunks of SWAPS_CHUNK.
+        """
+        blocks, timestamps, prices = [[array[:0]] for array in self.arrays()]
+        result = await session.stream(queries.swap_prices(self.pair_ids, from_, to))
+        async for rows in result.partitions(SWAPS_CHUNK):
+            blocks.append(np.array([r[0] for r in rows], dtype=np.int64))
+            timestamps.append(np.array([r[1] for r in rows], dtype=np.int64))
+            prices.append(
+                np.array(
+                    [swap_price(r[2], r[3], self.base_pair_id) for r in rows],
+                    dtype=np.float64,
+                )
+            )
+        return (
+            np.concatenate(blocks),
+            np.concatenate(timestamps),
+            np.concatenate(prices),
+        )
+
+    async def update(self, session, since: int):
+        """
+        Load swaps since <since> ms which are not loaded yet and swaps added since
+        last update.
+        """
+        async with self.lock:
+            if self.start is None:
+                self.start = since
+            elif since < self.start:
+                earlier = await self.load(session, since, self.start)
+                self.blocks, self.timestamps, self.prices = [
+                    np.concatenate(arrays) for arrays in zip(earlier, self.arrays())
+                ]
+                self.start = since
+            # importer commits whole blocks, so there are no late swaps
+            # with timestamp of last one
+            after = int(self.timestamps[-1]) + 1 if len(self.timestamps) else self.start
+            later = await self.load(session, after)
+            self.blocks, self.timestamps, self.prices = [
+                np.concatenate(arrays) for arrays in zip(self.arrays(), later)
+            ]
+
+    def lookup(self, column: str, values: list):
+        """
+        Return (price, block, timestamp) or None for each of <values> of <column>
+        ("block" or "timestamp"), as of last swap with <column> <= value.
+        """
+        # both blocks and timestamps are sorted, so binary search works for both
+        positions = np.searchsorted(getattr(self, column + "s"), values, "right") - 1
+        return [
+            None
+            if i < 0
+            else (float(self.prices[i]), int(self.blocks[i]), int(self.timestamps[i]))
+            for i in positions.tolist()
+        ]
+
+
+class PriceHistory:
+    """
+    Least recently used PriceSeries of up to HOT_PAIRS pairs.
+    """
+
+    def __init__(self, size: int = HOT_PAIRS):
+        self.size = size
+        self.series = OrderedDict()
+
+    async def lookup(
+        self, session, pair_ids: list, base_pair_id: int, column: str, values: list
+    ):
+        """
+        Return PriceSeries.lookup() of pair, loading its swaps since last one at or
+        before earliest of <values> if they are not loaded.
+        """
+        # reverse pair may be created after series of pair was
+        key = base_pair_id, tuple(sorted(pair_ids))
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = PriceSeries(pair_ids, base_pair_id)
+            if len(self.series) > self.size:
+                self.series.popitem(last=False)
+        else:
+            self.series.move_to_end(key)
+        since = series.start
+        if not series.covers(column, min(values)):
+            last = await lookup_price(
+                session, pair_ids, base_pair_id, column, min(values)
+            )
+            # without earlier swaps all of them are needed
+            since = last[2] if last else 0
+        await series.update(session, since)
+        return series.lookup(column, values)
@@ -0,0 +1,253 @@
+"""
+Builders of hot SQL queries of web API and importer. Their plans are checked by
+test_query_plans.py, so index changes turning them into sequential scans are caught.
+"""
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload, selectinload
+
+from models import CANDLE_INTERVALS, DENOM, Candle, Pair, Swap, Token
+
+
+def tokens_after(key: int):
+    """
+    (key, asset id) of tokens with keys greater than <key>.
+    """
+    return select(Token.id, Token.asset_id).where(Token.id > key)
+
+
+def pairs_with_tokens():
+    """
+    All pairs with their tokens, /pairs/.
+    """
+    return select(Pair).options(
+        selectinload(Pair.from_token), selectinload(Pair.to_token)
+    )
+
+
+def candle_price_ranges(since: int):
+    """
+    (pair id, high, low) of 5 minute candles of pairs starting from <since> ms.
+    """
+    candle_ms = CANDLE_INTERVALS["5m"] * 1000
+    return (
+        select(
+            Candle.pair_id,
+            func.max(Candle.high).label("high_price"),
+            func.min(Candle.low).label("low_price"),
+        )
+        .where(Candle.interval == CANDLE_INTERVALS["5m"])
+        .where(Candle.timestamp >= since - since % candle_ms)
+        .group_by(Candle.pair_id)
+    )
+
+
+def tickers(since: int):
+    """
+    (pair with tokens, high, low) of pairs having swaps, prices since <since> ms,
+    /tickers/.
+    """
+    ranges = candle_price_ranges(since).subquery()
+    return (
+        select(Pair, ranges.c.high_price, ranges.c.low_price)
+        .outerjoin(ranges, ranges.c.pair_id == Pair.id)
+        .where(Pair.last_timestamp.isnot(None))
+        .options(joinedload(Pair.from_token), joinedload(Pair.to_token))
+    )
+
+
+def priced_pairs():
+    """
+    (id, from token id, to token id, quote price, last price, from token liquidity,
+    to token liquidity) of pairs having swaps, for price routes.
+    """
+    return select(
+        Pair.id,
+        Pair.from_token_id,
+        Pair.to_token_id,
+        Pair.quote_price,
+        Pair.last_price,
+        Pair.from_token_liquidity,
+        Pair.to_token_liquidity,
+    ).where(Pair.last_timestamp.isnot(None))
+
+
+def pairs_by_symbols(base: str, quote: str):
+    """
+    Pairs with their tokens of tokens with <base> and <quote> symbols.
+    """
+    from_token = Token.__table__.alias("from_token")
+    to_token = Token.__table__.alias("to_token")
+    return (
+        select(Pair)
+        .options(selectinload(Pair.from_token), selectinload(Pair.to_token))
+        .join(from_token, from_token.c.id == Pair.from_token_id)
+        .join(to_token, to_token.c.id == Pair.to_token_id)
+        .where(and_(from_token.c.symbol == base, to_token.c.symbol == quote))
+    )
+
+
+def pair_by_tokens(from_token_id, to_token_id):
+    """
+    Pair of <from_token_id> -> <to_token_id> swaps.
+    """
+    return select(Pair).where(
+        Pair.from_token_id == from_token_id, Pair.to_token_id == to_token_id
+    )
+
+
+def ticker_pairs(base_id, target_id):
+    """
+    Pairs of swaps in both directions between <base_id> and <target_id> tokens.
+    """
+    return select(Pair).where(
+        or_(
+            and_(Pair.from_token_id == base_id, Pair.to_token_id == target_id),
+            and_(Pair.from_token_id == target_id, Pair.to_token_id == base_id),
+        )
+    )
+
+
+def pair_candles(pair_ids: list, interval: int, from_: int, to: int):
+    """
+    Candles of <pair_ids> of <interval> seconds overlapping [<from_>, <to>] ms.
+    """
+    return (
+        select(Candle)
+        .where(Candle.pair_id.in_(pair_ids))
+        .where(Candle.interval == interval)
+        .where(Candle.timestamp >= from_ - from_ % (interval * 1000))
+        .where(Candle.timestamp <= to)
+    )
+
+
+def trades(
+    pair_ids: list,
+    from_: int = None,
+    to: int = None,
+    limit: int = None,
+    from_block: int = None,
+    to_block: int = None,
+):
+    """
+    (id, timestamp, block, txid, pair id, from amount, to amount) of swaps of
+    <pair_ids> in [<from_>, <to>) ms and [<from_block>, <to_block>) blocks, newest
+    first, /historical_trades.
+    """
+    q = (
+        select(
+            Swap.id,
+            Swap.timestamp,
+            Swap.block,
+            Swap.txid,
+            Swap.pair_id,
+            Swap.from_amount,
+            Swap.to_amount,
+        )
+        .where(Swap.pair_id.in_(pair_ids))
+        .order_by(Swap.timestamp.desc(), Swap.id.desc())
+    )
+    if from_ is not None:
+        q = q.where(Swap.timestamp >= from_)
+    if to is not None:
+        q = q.where(Swap.timestamp < to)
+    q = in_blocks(q, Swap, from_block, to_block)
+    if limit is not None:
+        q = q.limit(limit)
+    return q
+
+
+def in_blocks(q, model, from_block: int = None, to_block: int = None):
+    """
+    Restrict <q> to rows of Swap, Burn or BuyBack <model> in [<from_block>,
+    <to_block>) blocks.
+    """
+    if from_block is not None:
+        q = q.where(model.block >= from_block)
+    if to_block is not None:
+        q = q.where(model.block < to_block)
+    return q
+
+
+def last_swap_price(pair_id: int, column: str, value: int):
+    """
+    (block, timestamp, id, price) of last swap of pair with <column> ("block" or
+    "timestamp") <= <value>, the last imported one of swaps with the same <column>.
+    """
+    column = getattr(Swap, column)
+    return (
+        select(Swap.block, Swap.timestamp, Swap.id, Swap.price)
+        .where(Swap.pair_id == pair_id)
+        .where(column <= value)
+        .order_by(column.desc(), Swap.id.desc())
+        .limit(1)
+    )
+
+
+def swap_prices(pair_ids: list, from_: int, to: int = None):
+    """
+    (block, timestamp, pair id, price) of swaps of <pair_ids> in [<from_>, <to>) ms,
+    to the last one if <to> is None, in timestamp order.
+    """
+    q = (
+        select(Swap.block, Swap.timestamp, Swap.pair_id, Swap.price)
+        .where(Swap.pair_id.in_(pair_ids))
+        .where(Swap.timestamp >= from_)
+        .order_by(Swap.timestamp, Swap.id)
+    )
+    if to is not None:
+        q = q.where(Swap.timestamp < to)
+    return q
+
+
+def window_swaps(pair_ids: list, from_: int, to: int):
+    """
+    (timestamp, pair id, from amount, to amount) of swaps of <pair_ids> in
+    [<from_>, <to>) ms, in timestamp order.
+    """
+    return (
+        select(Swap.timestamp, Swap.pair_id, Swap.from_amount, Swap.to_amount)
+        .where(Swap.pair_id.in_(pair_ids))
+        .where(Swap.timestamp >= from_)
+        .where(Swap.timestamp < to)
+        .order_by(Swap.timestamp, Swap.id)
+    )
+
+
+def swapped_amounts(side: str, since: int):
+    """
+    (token id, sum of amounts) of tokens swapped on <side> ("from" or "to") of pairs
+    after <since> ms.
+    """
+    token_id = getattr(Pair, side + "_token_id")
+    return (
+        select(token_id, func.sum(getattr(Swap, side + "_amount")))
+        .where(Swap.timestamp > since)
+        .join(Pair, Pair.id == Swap.pair_id)
+        .group_by(token_id)
+    )
+
+
+def token_amounts(model, since: int):
+    """
+    (token id, sum of amounts) of Burn or BuyBack <model> after <since> ms.
+    """
+    return (
+        select(model.token_id, func.sum(model.amount))
+        .where(model.timestamp > since)
+        .group_by(model.token_id)
+    )
+
+
+def update_pair_volumes(since: int):
+    """
+    Set Pair.from_volume and Pair.to_volume to amounts swapped after <since> ms.
+    """
+    return update(Pair).values(
+        from_volume=select(func.sum(Swap.from_amount / DENOM))
+        .where(and_(Swap.pair_id == Pair.id, Swap.timestamp > since))
+        .scalar_subquery(),
+        to_volume=select(func.sum(Swap.to_amount / DENOM))
+        .where(and_(Swap.pair_id == Pair.id, Swap.timestamp > since))
+        .scalar_subquery(),
+    )
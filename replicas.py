@@ -0,0 +1,51 @@
+"""
+Routing of read-only sessions to replicas of the database with failover.
+"""
+import logging
+from time import monotonic
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+# replica failing to connect is not used for that many seconds
+REPLICA_RETRY_INTERVAL = 30
+
+
+class ReadReplicas:
+    """
+    Sessions of replica engines in round-robin order. Replica failing to connect
+    is skipped for REPLICA_RETRY_INTERVAL, primary is used if none is available.
+    """
+
+    def __init__(self, engines, primary_session):
+        self.sessions = [
+            sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            for engine in engines
+        ]
+        self.primary_session = primary_session
+        # monotonic time until which replica is considered down
+        self.down_until = [0.0] * len(engines)
+        self.next = 0
+
+    async def session(self) -> AsyncSession:
+        """
+        Return session connected to next healthy replica or primary session.
+        """
+        count = len(self.sessions)
+        for i in range(count):
+            index = (self.next + i) % count
+            if self.down_until[index] > monotonic():
+                continue
+            session = self.sessions[index]()
+            try:
+                # checks connection out of pool, which pings it
+                await session.connection()
+            except (OSError, DBAPIError):
+                logging.exception("Replica %i is unavailable", index)
+                await session.close()
+                self.down_until[index] = monotonic() + REPLICA_RETRY_INTERVAL
+                continue
+            self.next = index + 1
+            return session
+        return self.primary_session()
@@ -3,19 +3,23 @@ import asyncio
 import logging
 import sys
 from dataclasses import asdict
+from datetime import datetime, timezone
 from decimal import Decimal
 from time import time
 from typing import Dict, List
 
 import decouple
 from scalecodec.type_registry import load_type_registry_file
-from sqlalchemy import and_, func, update
+from sqlalchemy import func, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 from substrateinterface import SubstrateInterface
 from tqdm import trange
 
-from models import Burn, BuyBack, Pair, Swap, Token
+import queries
+from market import notify_import, update_snapshots
+from models import CANDLE_INTERVALS, DENOM, Burn, BuyBack, Candle, Pair, Swap, Token
 from processing import (
     CURRENCIES,
     DEPOSITED,
@@ -29,16 +33,28 @@ from processing import (
     get_timestamp,
     get_value,
 )
+from snapshot_file import compress_reply, write_snapshot_file
+from token_registry import token_registry
 
 # Enable logging of RPC requests
 # substrateinterface.logger.setLevel(logging.DEBUG)
 
-DENOM = Decimal(10 ** 18)
-
 SWAP_FEE_ASSETS = {}
 
+# snapshot file shared with web workers, see snapshot_file.py
+SNAPSHOT_PATH = decouple.config("SNAPSHOT_PATH", default=None)
+
 POLL_INTERVAL = 60
 
+# tables partitioned by month of timestamp in PostgreSQL
+PARTITIONED_TABLES = ("swap", "burn", "buyback")
+
+# create partitions that many months ahead of imported block
+PARTITIONS_AHEAD = 2
+
+# (year, month) for which partitions are known to exist
+PARTITIONED_MONTHS = set()
+
 # BLOCK_IMPORT_LIMIT = 10 # In blocks, 0, None or float("inf") - to not stop
 
 # WAIT_FOR_NEXT_IMPORT = 4 # In seconds
@@ -155,20 +171,24 @@ def process_events(dataset, func_map, result, grouped_events, get_fee_price):
                     dataset.append(asdict(tx))
 
 
-async def get_or_create_token(substrate, session, id: int) -> Token:
-    q = session.execute(select(Token).where(Token.id == Decimal(id)))
-    for (token,) in await q:
-        return token
+async def get_or_create_token(substrate, session, id: int) -> int:
+    """
+    Return key of token with asset <id>, creating it from chain asset info if new.
+    """
+    key = await token_registry.key(session, id)
+    if key is not None:
+        return key
     assets = substrate.rpc_request("assets_listAssetInfos", [])["result"]
     for a in assets:
         if int(a["asset_id"], 16) == id:
             a = Token(
-                id=id, name=a["name"], symbol=a["symbol"], decimals=int(
+                asset_id=id, name=a["name"], symbol=a["symbol"], decimals=int(
                     a["precision"])
             )
             session.add(a)
             await session.commit()
-            return a
+            token_registry.add(a.id, id)
+            return a.id
     logging.error("Asset not found: " + hash)
     raise RuntimeError("Asset not found: " + hash)
 
@@ -179,7 +199,7 @@ async def get_or_create_pair(
     if (from_token_id, to_token_id) not in pairs:
         from_token = get_or_create_token(substrate, session, from_token_id)
         to_token = get_or_create_token(substrate, session, to_token_id)
-        p = Pair(from_token_id=(await from_token).id, to_token_id=(await to_token).id)
+        p = Pair(from_token_id=await from_token, to_token_id=await to_token)
         session.add(p)
         await session.commit()
         pairs[from_token_id, to_token_id] = p
@@ -192,7 +212,7 @@ async def get_all_pairs(session):
         select(Pair).options(selectinload(
             Pair.from_token), selectinload(Pair.to_token))
     ):
-        pairs[p.from_token.id, p.to_token.id] = p
+        pairs[p.from_token.asset_id, p.to_token.asset_id] = p
     return pairs
 
 async def update_all_pairs_liquidity(session, substrate, last_24h):
@@ -206,12 +226,14 @@ async def update_all_pairs_liquidity(session, substrate, last_24h):
     result_pairs = result.scalars().all()
 
     for pair in result_pairs:
+        from_asset_id = await token_registry.asset_id(session, pair.from_token_id)
+        to_asset_id = await token_registry.asset_id(session, pair.to_token_id)
         result = substrate.query(
             module="PoolXYK",
             storage_function="Reserves",
             params=[
-                "0x" + hex(int(pair.from_token_id))[2:].zfill(64),
-                "0x" + hex(int(pair.to_token_id))[2:].zfill(64),
+                "0x" + hex(from_asset_id)[2:].zfill(64),
+                "0x" + hex(to_asset_id)[2:].zfill(64),
             ],
         )
 
@@ -219,8 +241,8 @@ async def update_all_pairs_liquidity(session, substrate, last_24h):
             module="PoolXYK",
             storage_function="Reserves",
             params=[
-                "0x" + hex(int(pair.to_token_id))[2:].zfill(64),
-                "0x" + hex(int(pair.from_token_id))[2:].zfill(64),
+                "0x" + hex(to_asset_id)[2:].zfill(64),
+                "0x" + hex(from_asset_id)[2:].zfill(64),
             ],
         )
 
@@ -238,28 +260,10 @@ async def update_volumes(session, last_24h):
     Update Pair.from_volume, Pair.to_volume and Token.trade_volume.
     Session not commited.
     """
-    from_amounts = session.execute(
-        select(Pair.from_token_id, func.sum(Swap.from_amount))
-        .where(Swap.timestamp > last_24h)
-        .join(Pair, Pair.id == Swap.pair_id)
-        .group_by(Pair.from_token_id)
-    )
-    to_amounts = session.execute(
-        select(Pair.to_token_id, func.sum(Swap.to_amount))
-        .where(Swap.timestamp > last_24h)
-        .join(Pair, Pair.id == Swap.pair_id)
-        .group_by(Pair.to_token_id)
-    )
-    burn_amounts = session.execute(
-        select(Burn.token_id, func.sum(Burn.amount))
-        .where(Burn.timestamp > last_24h)
-        .group_by(Burn.token_id)
-    )
-    buyback_amounts = session.execute(
-        select(BuyBack.token_id, func.sum(BuyBack.amount))
-        .where(BuyBack.timestamp > last_24h)
-        .group_by(BuyBack.token_id)
-    )
+    from_amounts = session.execute(queries.swapped_amounts("from", last_24h))
+    to_amounts = session.execute(queries.swapped_amounts("to", last_24h))
+    burn_amounts = session.execute(queries.token_amounts(Burn, last_24h))
+    buyback_amounts = session.execute(queries.token_amounts(BuyBack, last_24h))
     tokens = session.execute(select(Token))
     from_amounts = dict(list(await from_amounts))
     to_amounts = dict(list(await to_amounts))
@@ -276,16 +280,131 @@ async def update_volumes(session, last_24h):
         token.trade_volume = volume
         objects.append(token)
     session.add_all(objects)
-    await session.execute(
-        update(Pair).values(
-            from_volume=select(func.sum(Swap.from_amount / DENOM))
-            .where(and_(Swap.pair_id == Pair.id, Swap.timestamp > last_24h))
-            .scalar_subquery(),
-            to_volume=select(func.sum(Swap.to_amount / DENOM))
-            .where(and_(Swap.pair_id == Pair.id, Swap.timestamp > last_24h))
-            .scalar_subquery(),
+    await session.execute(queries.update_pair_volumes(last_24h))
+
+
+def get_insert(session, model):
+    """
+    Return dialect specific INSERT statement for <model> supporting ON CONFLICT.
+    """
+    dialect = postgresql if session.bind.dialect.name == "postgresql" else sqlite
+    return dialect.insert(model)
+
+
+def insert_ignore(session, model):
+    """
+    Return INSERT statement for <model> which skips rows that are already
+    in DB (violate unique constraint), so block ranges can be re-imported.
+    """
+    return get_insert(session, model).on_conflict_do_nothing()
+
+
+async def update_candles(session, pair_ids, timestamp):
+    """
+    Recalculate candles of <pair_ids> containing <timestamp> (in ms).
+    Minute candles are calculated from swaps, others from candles of previous interval.
+    Session not commited.
+    """
+    source = None
+    for interval in CANDLE_INTERVALS.values():
+        start = int(timestamp) - int(timestamp) % (interval * 1000)
+        end = start + interval * 1000
+        grouped = {}
+        if source is None:
+            swaps = await session.execute(
+                select(
+                    Swap.pair_id,
+                    Swap.price,
+                    Swap.from_amount,
+                    Swap.to_amount,
+                    Swap.timestamp,
+                )
+                .where(Swap.pair_id.in_(pair_ids))
+                .where(Swap.timestamp >= start, Swap.timestamp < end)
+                .where(Swap.price.isnot(None))
+                .order_by(Swap.timestamp, Swap.id)
+            )
+            # every swap is a candle on its own
+            for pair_id, price, from_amount, to_amount, ts in swaps:
+                grouped.setdefault(pair_id, []).append(
+                    (
+                        price,
+                        price,
+                        price,
+                        price,
+                        from_amount / DENOM,
+                        to_amount / DENOM,
+                        1,
+                        ts,
+                        ts,
+                    )
+                )
+        else:
+            candles = await session.execute(
+                select(
+                    Candle.pair_id,
+                    Candle.open,
+                    Candle.high,
+                    Candle.low,
+                    Candle.close,
+                    Candle.from_volume,
+                    Candle.to_volume,
+                    Candle.swaps,
+                    Candle.open_timestamp,
+                    Candle.close_timestamp,
+                )
+                .where(Candle.pair_id.in_(pair_ids))
+                .where(Candle.interval == source)
+                .where(Candle.timestamp >= start, Candle.timestamp < end)
+                .order_by(Candle.timestamp)
+            )
+            for pair_id, *candle in candles:
+                grouped.setdefault(pair_id, []).append(candle)
+        if grouped:
+            insert = get_insert(session, Candle)
+            await session.execute(
+                insert.on_conflict_do_update(
+                    index_elements=["pair_id", "interval", "timestamp"],
+                    set_={
+                        c.name: insert.excluded[c.name]
+                        for c in Candle.__table__.columns
+                        if not c.primary_key
+                    },
+                ),
+                [
+                    dict(
+                        pair_id=pair_id,
+                        interval=interval,
+                        timestamp=start,
+                        **Candle.merge(pair_candles)
+                    )
+                    for pair_id, pair_candles in grouped.items()
+                ],
+            )
+        source = interval
+
+
+async def ensure_partitions(session, timestamp):
+    """
+    Make sure monthly partitions exist for the month of <timestamp> (in ms)
+    and PARTITIONS_AHEAD months after it. No-op on databases other than PostgreSQL.
+    """
+    if session.bind.dialect.name != "postgresql":
+        return
+    date = datetime.fromtimestamp(timestamp / 1000, timezone.utc)
+    if (date.year, date.month) in PARTITIONED_MONTHS:
+        return
+    months = [
+        (date.year + (date.month - 1 + i) // 12, (date.month - 1 + i) % 12 + 1)
+        for i in range(PARTITIONS_AHEAD + 1)
+    ]
+    until = datetime(*months[-1], 1, tzinfo=timezone.utc).timestamp() * 1000
+    for table in PARTITIONED_TABLES:
+        await session.execute(
+            text("SELECT create_monthly_partitions(:table, :from_ts, :to_ts)"),
+            {"table": table, "from_ts": int(timestamp), "to_ts": int(until)},
         )
-    )
+    PARTITIONED_MONTHS.update(months)
 
 
 def get_event_param(event, param_idx):
@@ -333,15 +452,14 @@ async def async_main(async_session, begin=1, clean=False, silent=False):
         if last:
             begin = last + 1
         # sync from last block in the DB to last block in the chain
-        pending = None
         if not silent:
             logging.info("Importing from %i to %i", begin, end)
         # make sure XOR, XSTUSD, VAL, PSWAP and VXOR token entries created
         # be able to import burns and buybacks
-        await get_or_create_token(substrate, session, xor_id_int)
+        xor_key = await get_or_create_token(substrate, session, xor_id_int)
         await get_or_create_token(substrate, session, xstusd_id_int)
-        await get_or_create_token(substrate, session, val_id_int)
-        await get_or_create_token(substrate, session, pswap_id_int)
+        val_key = await get_or_create_token(substrate, session, val_id_int)
+        pswap_key = await get_or_create_token(substrate, session, pswap_id_int)
         await get_or_create_token(substrate, session, vxor_id_int)
         for block in (range if silent or not sys.stdout.isatty() else trange)(
             begin, end
@@ -364,10 +482,6 @@ async def async_main(async_session, begin=1, clean=False, silent=False):
             timestamp = get_timestamp(res)
             get_fee_price = get_fee_price_func(substrate, block_hash, pairs)
             process_events(dataset, func_map, res, grouped_events, get_fee_price)
-            # await previous INSERT to finish if any
-            if pending:
-                await pending
-                pending = None
             # prepare data to be INSERTed
             swaps = []
             for tx in dataset:
@@ -425,7 +539,7 @@ async def async_main(async_session, begin=1, clean=False, silent=False):
                             )
                     tx["filter_mode"] = tx["filter_mode"][0]
                     tx["txid"] = tx.pop("id")
-                    for from_asset, from_amount, to_asset, to_amount in data:
+                    for leg, (from_asset, from_amount, to_asset, to_amount) in enumerate(data):
                         tx["pair_id"] = (
                             await get_or_create_pair(
                                 substrate, session, pairs, from_asset, to_asset
@@ -436,8 +550,9 @@ async def async_main(async_session, begin=1, clean=False, silent=False):
                                 dex_id,
                                 from_asset,
                                 to_asset,
-                                Swap(
+                                dict(
                                     block=block,
+                                    leg=leg,
                                     from_amount=from_amount,
                                     to_amount=to_amount,
                                     **tx
@@ -450,7 +565,7 @@ async def async_main(async_session, begin=1, clean=False, silent=False):
                     )
                     logging.error(e)
                     raise
-            # collect burns/buybacks
+            # collect burns/buybacks keyed by index of event they are derived from
             burns = []
             buybacks = []
             for idx, e in enumerate(events):
@@ -476,19 +591,21 @@ async def async_main(async_session, begin=1, clean=False, silent=False):
                             - pswap_reminted_lp
                         )
                         burns.append(
-                            Burn(
+                            dict(
                                 block=block,
                                 timestamp=timestamp,
-                                token_id=pswap_id_int,
+                                token_id=pswap_key,
                                 amount=pswap_burned,
+                                event_index=idx,
                             )
                         )
                         buybacks.append(
-                            BuyBack(
+                            dict(
                                 block=block,
                                 timestamp=timestamp,
-                                token_id=pswap_id_int,
+                                token_id=pswap_key,
                                 amount=pswap_reminted_lp + pswap_reminted_parliament,
+                                event_index=idx,
                             )
                         )
                 elif module == "XorFee" and event == "FeeWithdrawn":
@@ -499,11 +616,12 @@ async def async_main(async_session, begin=1, clean=False, silent=False):
                         # no events with this info, only estimation
                         xor_burned_estimated = int(xor_total_fee * 0.4)
                         burns.append(
-                            Burn(
+                            dict(
                                 block=block,
                                 timestamp=timestamp,
-                                token_id=xor_id_int,
+                                token_id=xor_key,
                                 amount=xor_burned_estimated,
+                                event_index=idx,
                             )
                         )
                         if len(events) > idx + 2:
@@ -517,11 +635,12 @@ async def async_main(async_session, begin=1, clean=False, silent=False):
                                     events[idx + 2], 2
                                 )
                                 buybacks.append(
-                                    BuyBack(
+                                    dict(
                                         block=block,
                                         timestamp=timestamp,
-                                        token_id=xor_id_int,
+                                        token_id=xor_key,
                                         amount=xor_dedicated_for_buy_back,
+                                        event_index=idx + 2,
                                     )
                                 )
                         if len(events) > idx + 10:
@@ -549,22 +668,24 @@ async def async_main(async_session, begin=1, clean=False, silent=False):
                                         event_with_val_burned, 2
                                     )
                                     burns.append(
-                                        Burn(
+                                        dict(
                                             block=block,
                                             timestamp=timestamp,
-                                            token_id=val_id_int,
+                                            token_id=val_key,
                                             amount=val_burned,
+                                            event_index=idx + 9,
                                         )
                                     )
                                     val_reminted_parliament = get_event_param(
                                         event_with_val_reminted_parliament, 2
                                     )
                                     buybacks.append(
-                                        BuyBack(
+                                        dict(
                                             block=block,
                                             timestamp=timestamp,
-                                            token_id=val_id_int,
+                                            token_id=val_key,
                                             amount=val_reminted_parliament,
+                                            event_index=idx + 10,
                                         )
                                     )
             parsed_swaps = []
@@ -606,25 +727,38 @@ async def async_main(async_session, begin=1, clean=False, silent=False):
                     pair.quote_price = int(result["result"]["amount_without_impact"]) / DENOM
                 else:
                     pair.quote_price = None
+                pair.set_last_swap(swap[3])
                 session.add(pair)
                 parsed_swaps.append(swap[3])
             if parsed_swaps or burns:
+                await ensure_partitions(session, timestamp)
                 # save instances to DB
                 if parsed_swaps:
-                    session.add_all(parsed_swaps)
+                    pair_ids = list({s["pair_id"] for s in parsed_swaps})
+                    await session.execute(insert_ignore(session, Swap), parsed_swaps)
+                    await update_candles(session, pair_ids, timestamp)
+                    await notify_import(session, block, pair_ids=pair_ids)
                 if burns:
-                    session.add_all(burns)
-                    session.add_all(buybacks)
-                pending = session.commit()
-        # wait for pending DB commit to finish
-        if pending:
-            await pending
+                    await session.execute(insert_ignore(session, Burn), burns)
+                if buybacks:
+                    await session.execute(insert_ignore(session, BuyBack), buybacks)
+                # commit each block to deliver its notification without delay
+                await session.commit()
         if not silent:
             logging.info("Updating trade volumes...")
         last_24h = (time() - 24 * 3600) * 1000
         await update_volumes(session, last_24h)
         await update_all_pairs_liquidity(session, substrate, last_24h)
+        # precompute replies of web API for last imported block
+        version, bodies = await update_snapshots(session, max(begin, end) - 1)
+        await notify_import(session, max(begin, end) - 1, version=version)
         await session.commit()
+        if SNAPSHOT_PATH:
+            # share compressed replies with all web workers
+            write_snapshot_file(
+                SNAPSHOT_PATH,
+                {name: compress_reply(version, body) for name, body in bodies.items()},
+            )
 
 
 async def async_main_loop(async_session, args):
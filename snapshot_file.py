@@ -0,0 +1,116 @@
+"""
+Snapshots of /pairs/ and /tickers/ replies shared by all web workers through one
+memory-mapped file. The importer compresses replies once per import and replaces the
+file atomically, workers serve bodies straight from the mapping.
+
+File layout: 4 byte little-endian length of JSON index, JSON index
+{name: {"version": [block, updated], "etag": ..., "bodies": {coding: [offset, size]}}},
+then bodies.
+"""
+import gzip
+import json
+import mmap
+import os
+import struct
+import zlib
+
+import brotli
+
+# gzip and brotli levels of cached replies, compressed once per import
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+HEADER = struct.Struct("<I")
+
+
+def compress_reply(version, body: bytes, pair_ids=None):
+    """
+    Return cache entry with reply <body> serialized for every supported content coding.
+    Entry of reply built from <pair_ids> is dropped when importer changes them.
+    """
+    return {
+        "version": tuple(version),
+        "pairs": frozenset(pair_ids or ()),
+        "etag": '"%s-%s-%08x"' % (*version, zlib.crc32(body)),
+        "bodies": {
+            "br": brotli.compress(body, quality=BROTLI_QUALITY),
+            "gzip": gzip.compress(body, compresslevel=GZIP_LEVEL),
+            "identity": body,
+        },
+    }
+
+
+def write_snapshot_file(path: str, entries: dict):
+    """
+    Write {name: compress_reply() entry} to <path>, replacing previous file atomically.
+    """
+    index = {}
+    bodies = []
+    offset = 0
+    for name, entry in entries.items():
+        index[name] = {
+            "version": list(entry["version"]),
+            "etag": entry["etag"],
+            "bodies": {},
+        }
+        for coding, body in entry["bodies"].items():
+            index[name]["bodies"][coding] = [offset, len(body)]
+            bodies.append(body)
+            offset += len(body)
+    header = json.dumps(index).encode()
+    # write to temporary file first so readers never map partially written one
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(len(header)))
+        f.write(header)
+        for body in bodies:
+            f.write(body)
+    os.replace(path + ".tmp", path)
+
+
+class SnapshotFile:
+    """
+    Read-only view of snapshot file, remapped when importer replaces it.
+    Bodies are returned as memoryviews of the mapping, no copies are made.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stat = None
+        self.entries = {}
+
+    def get(self, name: str):
+        """
+        Return compress_reply()-like entry of <name> or None if there is no snapshot.
+        """
+        self.reload()
+        return self.entries.get(name)
+
+    def reload(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.stat, self.entries = None, {}
+            return
+        if not stat.st_size:
+            return
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key == self.stat:
+            return
+        with open(self.path, "rb") as f:
+            # previous mapping is closed when last reply using it is sent
+            data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        size, = HEADER.unpack_from(data)
+        start = HEADER.size + size
+        index = json.loads(bytes(data[HEADER.size:start]))
+        self.entries = {
+            name: {
+                "version": tuple(entry["version"]),
+                "etag": entry["etag"],
+                "bodies": {
+                    coding: data[start + offset:start + offset + length]
+                    for coding, (offset, length) in entry["bodies"].items()
+                },
+            }
+            for name, entry in index.items()
+        }
+        self.stat = key
@@ -1,18 +1,39 @@
 import asyncio
+import json
+import os
+import tempfile
 import unittest
 from decimal import Decimal
 from time import time
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 from fastapi.testclient import TestClient
+from sqlalchemy import event, func
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.future import select
 from sqlalchemy.orm import sessionmaker
 
-from models import Base, Pair, Swap, Token
-from processing import XOR_ID
-from run_node_processing import DENOM, update_all_pairs_liquidity, update_volumes
-from web import app, get_db
+from analytics import Averages
+from broadcast import Broadcaster
+from market import IMPORT_CHANNEL, FormattedFloat, render_json, update_snapshots
+from metrics import Histogram, after_cursor_execute
+from models import CANDLE_INTERVALS, Base, Burn, BuyBack, Candle, Pair, Swap, Token
+from orderbook import XYK_FEE, xyk_order_book
+from price_history import PriceHistory
+from price_engine import PriceEngine
+from processing import DAI_ID, VAL_ID, XOR_ID
+from replicas import ReadReplicas
+from run_node_processing import (
+    DENOM,
+    insert_ignore,
+    update_all_pairs_liquidity,
+    update_candles,
+    update_volumes,
+)
+from snapshot_file import SnapshotFile, compress_reply, write_snapshot_file
+from token_registry import token_registry
+import web
+from web import app, get_db, load_whitelist, set_whitelist
 
 SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
@@ -37,6 +58,8 @@ client = TestClient(app)
 
 class DBTestCase(unittest.TestCase):
     async def asyncSetUp(self):
+        # keys of tokens of previous test are gone with its tables
+        token_registry.clear()
         # create tables
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
@@ -53,6 +76,101 @@ class DBTestCase(unittest.TestCase):
         asyncio.run(self.asyncTearDown())
 
 
+class RenderJsonTest(unittest.TestCase):
+    def test_render_json(self):
+        self.assertEqual(
+            render_json({
+                "name": 'Token "quoted" it\'s',
+                "price": FormattedFloat(3.0),
+                "small": FormattedFloat(0.5e-17),
+                "amount": Decimal("1.1234567890123456789"),
+                "none": None,
+                "list": [FormattedFloat(float("nan")), 2],
+            }),
+            b'{"name":"Token \\"quoted\\" it\'s","price":3,"small":0.000000000000000005,'
+            b'"amount":1.123456789012345679,"none":null,"list":[null,2]}',
+        )
+
+
+class OrderBookTest(unittest.TestCase):
+    def test_xyk_order_book(self):
+        bids, asks = xyk_order_book(1000.0, 2000.0, 2)
+        # base bought or sold by pool until its price moves by 0.5%
+        self.assertAlmostEqual(asks[0][1], 1000 - (2000 * 1000 / (2 * 1.005)) ** 0.5)
+        self.assertAlmostEqual(bids[0][1], (2000 * 1000 / (2 * 0.995)) ** 0.5 - 1000)
+        self.assertAlmostEqual(asks[0][0], 2 * 1.005 / (1 - XYK_FEE))
+        self.assertAlmostEqual(bids[0][0], 2 * 0.995 * (1 - XYK_FEE))
+        self.assertGreater(asks[1][0], asks[0][0])
+        self.assertLess(bids[1][0], bids[0][0])
+        self.assertEqual(xyk_order_book(0.0, 2000.0, 2), ([], []))
+
+
+class PriceEngineTest(unittest.TestCase):
+    def test_widest_route(self):
+        dai, xor, val = int(DAI_ID, 16), int(XOR_ID, 16), int(VAL_ID, 16)
+        engine = PriceEngine()
+
+        def update(val_dai_liquidity, xor_dai_price=10):
+            # (id, from, to, quote price, last price, from liquidity, to liquidity)
+            engine.update([
+                (1, xor, dai, None, Decimal(xor_dai_price), 10000, 100000),
+                (2, val, xor, None, Decimal(2), 1000, 500),
+                (3, val, dai, None, Decimal(25), *val_dai_liquidity),
+            ])
+
+        # VAL priced through XOR, pool with DAI is shallower
+        update((1, 10))
+        self.assertEqual(
+            engine.prices([xor, val, dai, 5]), {xor: 10, val: 20, dai: 1, 5: 0}
+        )
+        update((400, 10000))
+        self.assertEqual(engine.price(val), 25)
+        # prices change along the same routes
+        routes = engine.routes
+        update((400, 10000), xor_dai_price=20)
+        self.assertIs(engine.routes, routes)
+        self.assertEqual(engine.prices([xor, val]), {xor: 20, val: 25})
+
+
+class ReadReplicasTest(unittest.TestCase):
+    def test_failover(self):
+        down = create_async_engine("sqlite+aiosqlite:////nonexistent/replica.db")
+        replicas = ReadReplicas([down, engine], TestingSessionLocal)
+
+        async def bind():
+            async with await replicas.session() as session:
+                return session.bind
+
+        with self.assertLogs(level="ERROR"):
+            self.assertIs(asyncio.run(bind()), engine)
+        # replica which is down is skipped without connecting
+        self.assertIs(asyncio.run(bind()), engine)
+        # primary is used if no replica is available
+        primary = Mock()
+        replicas = ReadReplicas([down], primary)
+        with self.assertLogs(level="ERROR"):
+            self.assertIs(asyncio.run(replicas.session()), primary.return_value)
+
+
+class TokenRegistryTest(DBTestCase):
+    def test_lookup(self):
+        xor = int(XOR_ID, 16)
+
+        async def inner():
+            async with TestingSessionLocal() as session:
+                session.add(Token(asset_id=1, name="D", decimals=18, symbol="DAI"))
+                await session.commit()
+                self.assertEqual(await token_registry.key(session, 1), 1)
+                self.assertIsNone(await token_registry.key(session, xor))
+                # token added after registry was loaded
+                session.add(Token(asset_id=xor, name="X", decimals=18, symbol="XOR"))
+                await session.commit()
+                self.assertEqual(await token_registry.key(session, xor), 2)
+                self.assertEqual(await token_registry.asset_id(session, 2), xor)
+
+        asyncio.run(inner())
+
+
 class ImportTest(DBTestCase):
     @patch("PoolXYK.substrate.query") 
     async def test_update_all_pairs_liquidity(self, mock_query):
@@ -76,8 +194,8 @@ class ImportTest(DBTestCase):
         }.get((module, storage_function, params), None)
 
         async with TestingSessionLocal() as session:
-            dai = Token(id=1, name="D", decimals=18, symbol="DAI")
-            xor = Token(id=2, name="X", decimals=18, symbol="XOR")
+            dai = Token(asset_id=1, name="D", decimals=18, symbol="DAI")
+            xor = Token(asset_id=2, name="X", decimals=18, symbol="XOR")
             session.add_all([dai, xor])
             pair = Pair(from_token=dai, to_token=xor)
             session.add(pair)
@@ -93,9 +211,9 @@ class ImportTest(DBTestCase):
         async def inner():
             # insert test data
             async with TestingSessionLocal() as session:
-                dai = Token(id=1, name="D", decimals=18, symbol="DAI")
+                dai = Token(asset_id=1, name="D", decimals=18, symbol="DAI")
                 session.add(dai)
-                xor = Token(id=int(XOR_ID, 16), name="X", decimals=18, symbol="XOR")
+                xor = Token(asset_id=int(XOR_ID, 16), name="X", decimals=18, symbol="XOR")
                 session.add(xor)
                 pair = Pair(from_token=dai, to_token=xor)
                 session.add(pair)
@@ -138,17 +256,146 @@ class ImportTest(DBTestCase):
 
         asyncio.run(inner())
 
+    def test_pair_set_last_swap(self):
+        pair = Pair()
+        swap = dict(block=2, txid=0x12, timestamp=5, from_amount=2, to_amount=3)
+        pair.set_last_swap(swap)
+        # older swap, e.g. of re-imported block, is ignored
+        pair.set_last_swap(dict(swap, block=1, timestamp=4, to_amount=8))
+        self.assertEqual(
+            (pair.last_price, pair.last_block, pair.last_hash, pair.last_timestamp),
+            (Decimal("1.5"), 2, "0x" + "0" * 62 + "12", 5),
+        )
+
+    def test_insert_swaps_idempotent(self):
+        async def inner():
+            async with TestingSessionLocal() as session:
+                dai = Token(asset_id=1, name="D", decimals=18, symbol="DAI")
+                xor = Token(asset_id=int(XOR_ID, 16), name="X", decimals=18, symbol="XOR")
+                pair = Pair(from_token=dai, to_token=xor)
+                session.add(pair)
+                await session.flush()
+                swaps = [
+                    dict(
+                        txid=0x1234,
+                        block=2,
+                        leg=leg,
+                        timestamp=3,
+                        pair_id=pair.id,
+                        xor_fee=4,
+                        from_amount=1,
+                        to_amount=2,
+                        filter_mode="mode",
+                    )
+                    for leg in range(2)
+                ]
+                # import the same block twice
+                await session.execute(insert_ignore(session, Swap), swaps)
+                await session.execute(insert_ignore(session, Swap), swaps)
+                await session.commit()
+                count = (await session.execute(func.count(Swap.id))).scalar()
+                self.assertEqual(count, 2)
+
+        asyncio.run(inner())
+
+    def test_insert_burns_idempotent(self):
+        async def inner():
+            async with TestingSessionLocal() as session:
+                xor = Token(asset_id=int(XOR_ID, 16), name="X", decimals=18, symbol="XOR")
+                session.add(xor)
+                await session.flush()
+                burns = [
+                    dict(
+                        block=2,
+                        timestamp=3,
+                        token_id=xor.id,
+                        amount=4,
+                        event_index=event_index,
+                    )
+                    for event_index in (5, 7)
+                ]
+                # import the same block twice
+                for model in (Burn, BuyBack, Burn, BuyBack):
+                    await session.execute(insert_ignore(session, model), burns)
+                await session.commit()
+                for model in (Burn, BuyBack):
+                    count = (await session.execute(func.count(model.id))).scalar()
+                    self.assertEqual(count, 2)
+
+        asyncio.run(inner())
+
+    def test_update_candles(self):
+        async def inner():
+            async with TestingSessionLocal() as session:
+                dai = Token(asset_id=1, name="D", decimals=18, symbol="DAI")
+                xor = Token(asset_id=int(XOR_ID, 16), name="X", decimals=18, symbol="XOR")
+                pair = Pair(from_token=dai, to_token=xor)
+                session.add(pair)
+                await session.flush()
+                # import swaps block by block
+                for id, (timestamp, to_amount) in enumerate(
+                    [(0, 2), (30000, 1), (61000, 4)]
+                ):
+                    session.add(
+                        Swap(
+                            id=id,
+                            block=id,
+                            timestamp=timestamp,
+                            pair=pair,
+                            xor_fee=4,
+                            from_amount=DENOM,
+                            to_amount=to_amount * DENOM,
+                            filter_mode="mode",
+                        )
+                    )
+                    await session.flush()
+                    await update_candles(session, [pair.id], timestamp)
+                await session.commit()
+                minutes = (
+                    await session.execute(
+                        select(Candle)
+                        .where(Candle.interval == CANDLE_INTERVALS["1m"])
+                        .order_by(Candle.timestamp)
+                    )
+                ).scalars().all()
+                self.assertEqual(
+                    [(c.timestamp, c.open, c.high, c.low, c.close, c.swaps) for c in minutes],
+                    [(0, 2, 2, 1, 1, 2), (60000, 4, 4, 4, 4, 1)],
+                )
+                day = (
+                    await session.execute(
+                        select(Candle).where(Candle.interval == CANDLE_INTERVALS["1d"])
+                    )
+                ).scalar()
+                self.assertEqual(
+                    (day.open, day.high, day.low, day.close, day.swaps), (2, 4, 1, 4, 3)
+                )
+                self.assertEqual(day.from_volume, 3)
+                self.assertEqual(day.to_volume, 7)
+                self.assertEqual((day.open_timestamp, day.close_timestamp), (0, 61000))
+
+        asyncio.run(inner())
+
 
 class WebAppTest(DBTestCase):
     async def asyncSetUp(self):
         await super().asyncSetUp()
         # insert test data
         async with TestingSessionLocal() as session:
-            dai = Token(id=1, name="D", decimals=18, symbol="DAI")
+            dai = Token(asset_id=1, name="D", decimals=18, symbol="DAI")
             session.add(dai)
-            xor = Token(id=int(XOR_ID, 16), name="X", decimals=18, symbol="XOR")
+            xor = Token(asset_id=int(XOR_ID, 16), name="X", decimals=18, symbol="XOR")
             session.add(xor)
-            dai_xor = Pair(from_token=dai, to_token=xor, from_volume=1, to_volume=2)
+            dai_xor = Pair(
+                from_token=dai,
+                to_token=xor,
+                from_volume=1,
+                to_volume=2,
+                last_price=3,
+                last_block=4,
+                last_txid=0x5678,
+                last_timestamp=5,
+            )
             xor_dai = Pair(from_token=xor, to_token=dai, from_volume=4, to_volume=8)
             session.add(dai_xor)
             session.add(xor_dai)
@@ -176,6 +423,8 @@ class WebAppTest(DBTestCase):
                 filter_mode="mode",
             )
             session.add(swap)
+            await session.flush()
+            await update_candles(session, [dai_xor.id, xor_dai.id], 3)
             await session.commit()
 
     def test_pairs_get(self):
@@ -202,10 +451,119 @@ class WebAppTest(DBTestCase):
             },
         )
 
-    @patch("web.get_whitelist")
-    def test_pair_get(self, whitelist_mock):
+    def test_pairs_get_snapshot(self):
+        expected = client.get("/pairs/").json()
+
+        async def inner():
+            async with TestingSessionLocal() as session:
+                await update_snapshots(session, 4)
+                await session.commit()
+                # changes after snapshot are not visible until next one
+                for pair in (await session.execute(select(Pair))).scalars():
+                    pair.from_volume = pair.to_volume = 100
+                await session.commit()
+
+        asyncio.run(inner())
+        response = client.get("/pairs/")
+        assert response.status_code == 200, response.text
+        self.assertEqual(response.json(), expected)
+
+    def test_pairs_get_cached(self):
+        async def inner(block):
+            async with TestingSessionLocal() as session:
+                await update_snapshots(session, block)
+                await session.commit()
+
+        asyncio.run(inner(4))
+        response = client.get("/pairs/", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200, response.text
+        etag = response.headers["ETag"]
+        data = response.json()
+        for encoding in ("gzip", "br"):
+            response = client.get("/pairs/", headers={"Accept-Encoding": encoding})
+            self.assertEqual(response.headers["Content-Encoding"], encoding)
+            self.assertEqual(response.json(), data)
+        response = client.get("/pairs/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        # new import invalidates cached reply
+        asyncio.run(inner(5))
+        response = client.get("/pairs/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    @patch("web.refresh_broadcaster", AsyncMock())
+    def test_import_notification(self):
+        async def inner():
+            async with TestingSessionLocal() as session:
+                await update_snapshots(session, 4)
+                await session.commit()
+
+        async def notify(*payloads):
+            for payload in payloads:
+                web.on_import(None, 0, IMPORT_CHANNEL, json.dumps(payload))
+            await getattr(web, "__refresh")["task"]
+
+        asyncio.run(inner())
+        set_whitelist([{"address": "0x1"}, {"address": XOR_ID}])
+        client.get("/pairs/DAI-XOR")
+        replies = getattr(web, "__replies")
+        self.assertIn(("pair", "DAI", "XOR"), replies)
+        # swaps of other pairs keep cached reply
+        asyncio.run(notify({"block": 5, "pairs": [3]}))
+        self.assertIn(("pair", "DAI", "XOR"), replies)
+        asyncio.run(notify({"block": 5, "pairs": [2]}))
+        self.assertNotIn(("pair", "DAI", "XOR"), replies)
+        web.refresh_broadcaster.assert_called_with([2], None)
+        asyncio.run(notify({"block": 5, "version": [5, 1]}))
+        web.refresh_broadcaster.assert_called_with(None, (5, 1))
+        # notifications received before refresh starts are merged into one
+        web.refresh_broadcaster.reset_mock()
+        asyncio.run(notify({"block": 6, "pairs": [2]}, {"block": 7, "pairs": [1]}))
+        web.refresh_broadcaster.assert_called_once_with([1, 2], None)
+        web.refresh_broadcaster.reset_mock()
+        asyncio.run(
+            notify({"block": 8, "pairs": [2]}, {"block": 8, "version": [8, 2]})
+        )
+        web.refresh_broadcaster.assert_called_once_with(None, (8, 2))
+
+        # ones received while refreshing are refreshed next by the same task
+        async def refresh(pair_ids, version):
+            if pair_ids == [1]:
+                web.on_import(None, 0, IMPORT_CHANNEL, json.dumps({"pairs": [3]}))
+
+        web.refresh_broadcaster.reset_mock()
+        web.refresh_broadcaster.side_effect = refresh
+        asyncio.run(notify({"block": 9, "pairs": [1]}))
+        self.assertEqual(
+            [c.args for c in web.refresh_broadcaster.call_args_list],
+            [([1], None), ([3], None)],
+        )
+
+    def test_pairs_get_shared_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "snapshots.bin")
+            shared = SnapshotFile(path)
+            self.assertIsNone(shared.get("pairs"))
+            write_snapshot_file(path, {"pairs": compress_reply((4, 1), b'{"a":1}')})
+            self.assertEqual(bytes(shared.get("pairs")["bodies"]["identity"]), b'{"a":1}')
+            # importer replaces file with next import
+            write_snapshot_file(
+                path,
+                {
+                    "pairs": compress_reply((5, 2), b'{"a":2}'),
+                    "tickers": compress_reply((5, 2), b"[]"),
+                },
+            )
+            with patch("web.shared_snapshots", shared):
+                response = client.get("/pairs/", headers={"Accept-Encoding": "gzip"})
+                self.assertEqual(response.json(), {"a": 2})
+                self.assertEqual(response.headers["Content-Encoding"], "gzip")
+                self.assertTrue(response.headers["ETag"].startswith('"5-2-'))
+                self.assertEqual(client.get("/tickers/").json(), [])
+
+    def test_pair_get(self):
         self.maxDiff = 1024
-        whitelist_mock.return_value = [{"address": "0x1"}, {"address": XOR_ID}]
+        set_whitelist([{"address": "0x1"}, {"address": XOR_ID}])
         response = client.get("/pairs/DAI-XOR")
         assert response.status_code == 200, response.text
         data = response.json()
@@ -226,6 +584,304 @@ class WebAppTest(DBTestCase):
             },
         )
 
+    def test_pair_get_not_whitelisted(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "whitelist.json")
+            with open(path, "w") as f:
+                json.dump([{"address": XOR_ID}], f)
+            with patch("web.WHITELIST_PATH", path):
+                self.assertTrue(load_whitelist())
+        response = client.get("/pairs/DAI-XOR")
+        self.assertEqual(response.status_code, 404)
+
+    def test_candles_get(self):
+        set_whitelist([{"address": "0x1"}, {"address": XOR_ID}])
+        response = client.get("/candles/DAI-XOR/?interval=1m&from=0&to=60000")
+        assert response.status_code == 200, response.text
+        data = response.json()
+        self.assertEqual(len(data), 1)
+        # volumes of test swaps are below Numeric precision of SQLite
+        self.assertLessEqual(
+            {"timestamp": 0, "open": 2, "high": 3, "low": 2, "close": 3, "swaps": 2}.items(),
+            data[0].items(),
+        )
+        response = client.get("/candles/DAI-XOR/?interval=2m")
+        self.assertEqual(response.status_code, 400)
+
+    def test_historical_trades_get(self):
+        ticker_id = "0x" + "0" * 63 + "1_" + XOR_ID
+        response = client.get(
+            "/historical_trades", params={"ticker_id": ticker_id, "from": 4}
+        )
+        assert response.status_code == 200, response.text
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        trades = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(len(trades), 1)
+        self.assertLessEqual(
+            {
+                "trade_id": 2,
+                "price": 3,
+                "trade_timestamp": 5,
+                "type": "sell",
+                "block": 4,
+                "txid": "0x" + "0" * 60 + "5678",
+            }.items(),
+            trades[0].items(),
+        )
+        response = client.get(
+            "/historical_trades",
+            params={"ticker_id": XOR_ID + "_0x" + "0" * 63 + "1", "format": "csv"},
+        )
+        assert response.status_code == 200, response.text
+        header, *rows = response.text.splitlines()
+        self.assertEqual(header.split(",")[:2], ["trade_id", "price"])
+        # newest first, XOR->DAI ticker buys XOR with DAI swaps
+        self.assertEqual([row.split(",")[0] for row in rows], ["2", "1"])
+        self.assertEqual(rows[1].split(",")[5], "buy")
+        response = client.get(
+            "/historical_trades",
+            params={"ticker_id": ticker_id, "from_block": 2, "to_block": 4},
+        )
+        trades = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([t["block"] for t in trades], [2])
+        response = client.get("/historical_trades", params={"ticker_id": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    @patch("web.price_history", new_callable=PriceHistory)
+    def test_price_get(self, price_history):
+        def prices(pair, **params):
+            response = client.get("/price", params=dict(pair=pair, **params))
+            assert response.status_code == 200, response.text
+            return [(p["price"], p["swap_block"]) for p in response.json()["prices"]]
+
+        set_whitelist([{"address": "0x1"}, {"address": XOR_ID}])
+        # single lookups
+        self.assertEqual(prices("DAI-XOR", block=3), [(2, 2)])
+        self.assertEqual(prices("DAI-XOR", timestamp=2), [(None, None)])
+        self.assertEqual(prices("XOR-DAI", timestamp=5), [(1 / 3, 4)])
+        # batch lookups from swaps in memory
+        self.assertEqual(
+            prices("DAI-XOR", timestamp=[10, 2, 3, 4, 5]),
+            [(3, 4), (None, None), (2, 2), (2, 2), (3, 4)],
+        )
+        self.assertEqual(prices("XOR-DAI", block=[2, 3]), [(0.5, 2), (0.5, 2)])
+        self.assertEqual(len(price_history.series), 2)
+        response = client.get("/price", params={"pair": "DAI-XOR"})
+        self.assertEqual(response.status_code, 400)
+        response = client.get("/price", params={"pair": "DAI-VAL", "block": 1})
+        self.assertEqual(response.status_code, 404)
+
+    @patch("web.price_history", new_callable=PriceHistory)
+    def test_price_get_swaps_in_same_block(self, price_history):
+        async def add_swaps():
+            async with TestingSessionLocal() as session:
+                # swaps of both pairs in block 4 after one of DAI-XOR at price 3
+                for id, pair_id, to_amount in ((3, 1, 7), (4, 2, 8)):
+                    session.add(
+                        Swap(
+                            id=id,
+                            txid=0x9abc,
+                            block=4,
+                            timestamp=5,
+                            pair_id=pair_id,
+                            xor_fee=4,
+                            from_amount=1,
+                            to_amount=to_amount,
+                            filter_mode="mode",
+                        )
+                    )
+                await session.commit()
+
+        asyncio.run(add_swaps())
+        set_whitelist([{"address": "0x1"}, {"address": XOR_ID}])
+        # last imported swap of block, no matter how many points are asked for
+        for column, values in (("timestamp", [5]), ("timestamp", [5, 6]), ("block", [4])):
+            response = client.get("/price", params={"pair": "DAI-XOR", column: values})
+            assert response.status_code == 200, response.text
+            self.assertEqual(response.json()["prices"][0]["price"], 1 / 8)
+
+    def test_price_history(self):
+        history = PriceHistory()
+
+        async def lookup(pair_ids, column, values):
+            async with TestingSessionLocal() as session:
+                return await history.lookup(session, pair_ids, 1, column, values)
+
+        # swaps are loaded from last one at or before requested ones
+        self.assertEqual(
+            asyncio.run(lookup([1], "timestamp", [6, 5])), [(3, 4, 5), (3, 4, 5)]
+        )
+        series, = history.series.values()
+        self.assertEqual(series.timestamps.tolist(), [5])
+        self.assertEqual(
+            asyncio.run(lookup([1], "block", [2, 4])), [(2, 2, 3), (3, 4, 5)]
+        )
+        self.assertEqual(series.timestamps.tolist(), [3, 5])
+        # series of pair with its reverse one is separate
+        asyncio.run(lookup([1, 2], "block", [1, 4]))
+        self.assertEqual(len(history.series), 2)
+
+    @patch("web.averages", new_callable=Averages)
+    def test_averages_get(self, averages):
+        set_whitelist([{"address": "0x1"}, {"address": XOR_ID}])
+        response = client.get("/twap", params={"pair": "DAI-XOR", "from": 0, "to": 10})
+        assert response.status_code == 200, response.text
+        # prices 2 from 3 ms, 3 from 5 ms
+        self.assertAlmostEqual(response.json()["twap"], 19 / 7)
+        # price of swap before window holds from its start
+        response = client.get("/twap", params={"pair": "DAI-XOR", "from": 4, "to": 7})
+        self.assertEqual(response.json()["swaps"], 1)
+        self.assertAlmostEqual(response.json()["twap"], 8 / 3)
+        response = client.get("/vwap", params={"pair": "XOR-DAI", "from": 0, "to": 10})
+        data = response.json()
+        self.assertEqual((data["vwap"], data["swaps"]), (0.4, 2))
+        self.assertEqual(averages.results, {})
+        response = client.get("/vwap", params={"pair": "XOR-DAI", "from": 6, "to": 10})
+        self.assertIsNone(response.json()["vwap"])
+        response = client.get("/twap", params={"pair": "XOR-DAI", "from": 6, "to": 6})
+        self.assertEqual(response.status_code, 400)
+
+        async def inner():
+            async with TestingSessionLocal() as session:
+                await update_snapshots(session, 4)
+                await session.commit()
+
+        # cached once import is known, until pair has new swaps
+        asyncio.run(inner())
+        client.get("/vwap", params={"pair": "DAI-XOR", "from": 0, "to": 10})
+        self.assertEqual(len(averages.results), 1)
+        averages.invalidate([2])
+        self.assertEqual(averages.results, {})
+
+    def test_prices_get(self):
+        set_whitelist([{"address": "0x1"}, {"address": XOR_ID}])
+        response = client.get("/prices")
+        assert response.status_code == 200, response.text
+        # no route to stable tokens
+        self.assertEqual(response.json(), {"0x" + "0" * 63 + "1": 0, XOR_ID: 0})
+        response = client.get("/prices", params={"tokens": XOR_ID + ",0x2"})
+        self.assertEqual(response.json(), {XOR_ID: 0})
+        response = client.get("/prices", params={"tokens": "DAI"})
+        self.assertEqual(response.status_code, 400)
+
+    @patch("metrics.SLOW_QUERY_THRESHOLD", 0)
+    def test_metrics_get(self):
+        set_whitelist([{"address": "0x1"}, {"address": XOR_ID}])
+        with self.assertLogs(level="WARNING") as logs:
+            response = client.get("/pairs/DAI-XOR/")
+        assert response.status_code == 200, response.text
+        self.assertIn("Slow query", logs.output[0])
+        self.assertIn("/pairs/{base}-{quote}/", logs.output[0])
+        response = client.get("/metrics")
+        assert response.status_code == 200, response.text
+        lines = response.text.splitlines()
+        self.assertIn("# TYPE sql_query_rows histogram", lines)
+        for name in ("http_request_duration_seconds", "sql_query_duration_seconds"):
+            self.assertIn("# TYPE %s histogram" % name, lines)
+            count = [
+                line
+                for line in lines
+                if line.startswith(name + '_count{route="/pairs/{base}-{quote}/"}')
+            ]
+            self.assertEqual(len(count), 1)
+            self.assertGreater(int(count[0].split()[-1]), 0)
+
+    @patch("metrics.query_rows", new_callable=lambda: Histogram("rows", "", (0, 10)))
+    def test_query_rows_metric(self, query_rows):
+        def execute(rowcount):
+            conn = Mock(info={"query_start": [0]})
+            cursor = Mock(rowcount=rowcount, description=None)
+            after_cursor_execute(conn, cursor, "", (), None, False)
+
+        # unknown count is not observed
+        execute(-1)
+        self.assertEqual(query_rows.series, {})
+        execute(2)
+        self.assertEqual(query_rows.series, {"background": [0, 1, 0, 2]})
+        # selected rows are counted as fetched, whatever count driver reports
+        query_rows.series.clear()
+        response = client.get("/pairs/DAI-XOR/")
+        assert response.status_code == 200, response.text
+        series = query_rows.series["/pairs/{base}-{quote}/"]
+        self.assertGreater(series[-1], 0)
+
+    def test_orderbook_get(self):
+        ticker_id = XOR_ID + "_0x" + "0" * 63 + "1"
+        response = client.get("/orderbook", params={"ticker_id": ticker_id, "depth": 4})
+        assert response.status_code == 200, response.text
+        self.assertEqual(response.json()["bids"], [])
+
+        async def set_liquidity():
+            async with TestingSessionLocal() as session:
+                # XOR->DAI pair
+                pair = await session.get(Pair, 2)
+                pair.from_token_liquidity = 1000
+                pair.to_token_liquidity = 2000
+                await session.commit()
+
+        asyncio.run(set_liquidity())
+        response = client.get("/orderbook", params={"ticker_id": ticker_id, "depth": 4})
+        data = response.json()
+        self.assertEqual(data["ticker_id"], ticker_id)
+        self.assertEqual((data["bids"], data["asks"]), xyk_order_book(1000.0, 2000.0, 2))
+        response = client.get("/orderbook", params={"ticker_id": "0x2_0x3"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_broadcaster(self):
+        broadcaster = Broadcaster()
+        queue = broadcaster.subscribe()
+
+        async def refresh(**kwargs):
+            async with TestingSessionLocal() as session:
+                await broadcaster.refresh(session, **kwargs)
+
+        def events():
+            while not queue.empty():
+                yield queue.get_nowait()
+
+        asyncio.run(refresh())
+        event, = events()
+        self.assertTrue(event.startswith(b"event: update\ndata: "))
+        self.assertEqual(len(json.loads(event.split(b"data: ")[1])), 2)
+        # nothing changed
+        asyncio.run(refresh())
+        self.assertEqual(list(events()), [])
+
+        async def update_pair():
+            async with TestingSessionLocal() as session:
+                pair = await session.get(Pair, 2)
+                pair.to_volume = 9
+                await session.commit()
+
+        asyncio.run(update_pair())
+        asyncio.run(refresh(pair_ids=[2]))
+        event, = events()
+        data = json.loads(event.split(b"data: ")[1])
+        self.assertEqual([(d["base_symbol"], d["quote_volume"]) for d in data], [("XOR", 9)])
+        self.assertEqual(
+            len(json.loads(broadcaster.snapshot().split(b"data: ")[1])), 2
+        )
+
+    def test_broadcaster_poll(self):
+        broadcaster = Broadcaster()
+        versions = iter([None, None, (5, 1), (5, 1)])
+
+        async def get_version(session):
+            for version in versions:
+                return version
+            raise asyncio.CancelledError
+
+        async def poll():
+            with self.assertRaises(asyncio.CancelledError):
+                await broadcaster.poll(TestingSessionLocal, 0, get_version)
+
+        # pairs are loaded once before first import and then once per import
+        with patch.object(broadcaster, "refresh", wraps=broadcaster.refresh) as refresh:
+            asyncio.run(poll())
+        self.assertEqual(
+            [call.kwargs["version"] for call in refresh.await_args_list], [None, (5, 1)]
+        )
+
     def test_graphql_post(self):
         response = client.post(
             "/graph", json=dict(query="{pairs{id, fromToken{symbol}, toToken{symbol}}}")
@@ -252,15 +908,117 @@ class WebAppTest(DBTestCase):
             },
         )
 
-    async def test_tickers_get(self):
-        response = await client.get("/tickers/")
+    def test_graphql_token_ids(self):
+        # tokens are exposed by asset ids, not by their keys in DB
+        response = client.post(
+            "/graph",
+            json=dict(query="{tokens{id, symbol}, pairs{fromTokenId, toTokenId}}"),
+        )
         assert response.status_code == 200, response.text
-        data = response.json()
+        data = response.json()["data"]
+        xor = float(int(XOR_ID, 16))
+        self.assertEqual(
+            data["tokens"], [{"id": 1, "symbol": "DAI"}, {"id": xor, "symbol": "XOR"}]
+        )
+        self.assertEqual(
+            data["pairs"],
+            [{"fromTokenId": 1, "toTokenId": xor}, {"fromTokenId": xor, "toTokenId": 1}],
+        )
+
+    def test_graphql_post_batches_relationships(self):
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
 
-        self.assertIsInstance(data, list)
-        self.assertGreater(len(data), 0)
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        try:
+            response = client.post(
+                "/graph",
+                json=dict(
+                    query="{swaps{pair{fromToken{symbol}, toToken{symbol}}},"
+                    " burns{token{symbol}}}"
+                ),
+            )
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", count)
+        assert response.status_code == 200, response.text
+        data = response.json()["data"]
+        self.assertEqual(len(data["swaps"]), 2)
+        for swap in data["swaps"]:
+            self.assertEqual(
+                swap["pair"], {"fromToken": {"symbol": "DAI"}, "toToken": {"symbol": "XOR"}}
+            )
+        # swaps, burns, their pairs and tokens of all of them
+        self.assertLessEqual(len(statements), 5, statements)
+
+    def test_graphql_swaps_connection(self):
+        def page(args):
+            response = client.post(
+                "/graph",
+                json=dict(
+                    query="{swapsConnection(%s){edges{cursor, node{block}},"
+                    " pageInfo{hasNextPage, hasPreviousPage, endCursor}}}" % args
+                ),
+            )
+            assert response.status_code == 200, response.text
+            return response.json()["data"]["swapsConnection"]
+
+        first = page("first: 1")
+        self.assertEqual([e["node"]["block"] for e in first["edges"]], [4])
+        self.assertTrue(first["pageInfo"]["hasNextPage"])
+        self.assertFalse(first["pageInfo"]["hasPreviousPage"])
+        second = page('first: 1, after: "%s"' % first["pageInfo"]["endCursor"])
+        self.assertEqual([e["node"]["block"] for e in second["edges"]], [2])
+        self.assertFalse(second["pageInfo"]["hasNextPage"])
+        self.assertTrue(second["pageInfo"]["hasPreviousPage"])
+        previous = page('last: 1, before: "%s"' % second["edges"][0]["cursor"])
+        self.assertEqual(previous["edges"], first["edges"])
+        self.assertEqual(page("pair: 2")["edges"], [])
+        edges = page('token: "%s", toTimestamp: 4, orderDirection: asc' % XOR_ID)["edges"]
+        self.assertEqual([e["node"]["block"] for e in edges], [2])
+        edges = page("fromBlock: 3, toBlock: 5")["edges"]
+        self.assertEqual([e["node"]["block"] for e in edges], [4])
 
-        ticker = data[0]
+    @patch(
+        "market.get_last_prices_in_dai",
+        AsyncMock(return_value={int(XOR_ID, 16): Decimal(2)}),
+    )
+    def test_tickers_get(self):
+        now = int(time() * 1000)
+
+        async def add_swaps():
+            async with TestingSessionLocal() as session:
+                # DAI->XOR pair, prices 2 and then 4 within last 24h
+                pair = await session.get(Pair, 1)
+                for id, to_amount, hours_ago in ((3, 2, 2), (4, 4, 1)):
+                    timestamp = now - hours_ago * 3600 * 1000
+                    session.add(
+                        Swap(
+                            id=id,
+                            txid=id,
+                            block=id + 2,
+                            timestamp=timestamp,
+                            pair=pair,
+                            xor_fee=4,
+                            from_amount=1,
+                            to_amount=to_amount,
+                            filter_mode="mode",
+                        )
+                    )
+                    await session.flush()
+                    await update_candles(session, [pair.id], timestamp)
+                pair.last_price = 4
+                pair.last_timestamp = timestamp
+                pair.from_token_liquidity = 10
+                pair.to_token_liquidity = 20
+                await session.commit()
+
+        asyncio.run(add_swaps())
+        response = client.get("/tickers/")
+        assert response.status_code == 200, response.text
+        # XOR->DAI pair has no swaps
+        (ticker,) = response.json()
         self.assertEqual(ticker["ticker_id"], "0x" + "0" * 63 + "1_" + XOR_ID)
         self.assertEqual(ticker["base_currency"], "0x" + "0" * 63 + "1")
         self.assertEqual(ticker["base_name"], "D")
@@ -268,9 +1026,10 @@ class WebAppTest(DBTestCase):
         self.assertEqual(ticker["target_currency"], XOR_ID)
         self.assertEqual(ticker["target_name"], "X")
         self.assertEqual(ticker["target_symbol"], "XOR")
-        self.assertEqual(ticker["last_price"], "0.5") 
-        self.assertEqual(ticker["base_volume"], "1.0")
-        self.assertEqual(ticker["target_volume"], "2.0")
-        self.assertEqual(ticker["liquidity_in_usd"], "1.0")
-        self.assertEqual(ticker["high"], "0.5")
-        self.assertEqual(ticker["low"], "0.5")
\ No newline at end of file
+        self.assertEqual(ticker["last_price"], 4)
+        self.assertEqual(ticker["base_volume"], 1)
+        self.assertEqual(ticker["target_volume"], 2)
+        # (10 DAI * 4 + 20 XOR) * 2 USD
+        self.assertEqual(ticker["liquidity_in_usd"], 120)
+        self.assertEqual(ticker["high"], 4)
+        self.assertEqual(ticker["low"], 2)
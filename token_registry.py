@@ -0,0 +1,56 @@
+"""
+In-memory map between 32-byte asset ids of tokens and their integer keys in DB.
+Tables reference tokens by keys, asset ids are only used at API and chain edges.
+"""
+import queries
+
+
+class TokenRegistry:
+    """
+    Asset id <-> key of every known token. Tokens are never deleted or renumbered
+    and only importer adds them, so entries are loaded once and kept; lookups of
+    unknown ones load tokens added since.
+    <db> of methods is anything with async execute(query): session or Loaders.
+    """
+
+    def __init__(self):
+        # asset id -> key
+        self.keys = {}
+        # key -> asset id
+        self.asset_ids = {}
+
+    def add(self, key: int, asset_id: int):
+        self.keys[asset_id] = key
+        self.asset_ids[key] = asset_id
+
+    def clear(self):
+        self.keys.clear()
+        self.asset_ids.clear()
+
+    async def load(self, db):
+        """
+        Load tokens added since last load.
+        """
+        last = max(self.asset_ids, default=0)
+        for key, asset_id in await db.execute(queries.tokens_after(last)):
+            self.add(key, int(asset_id))
+
+    async def key(self, db, asset_id: int):
+        """
+        Return key of token with <asset_id>, None if there is no such token.
+        """
+        asset_id = int(asset_id)
+        if asset_id not in self.keys:
+            await self.load(db)
+        return self.keys.get(asset_id)
+
+    async def asset_id(self, db, key: int) -> int:
+        """
+        Return asset id of token with <key>.
+        """
+        if key not in self.asset_ids:
+            await self.load(db)
+        return self.asset_ids[key]
+
+
+token_registry = TokenRegistry()
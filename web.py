@@ -1,113 +1,238 @@
-from decimal import Decimal, Context
 import logging
 from time import time
 
+import asyncio
+import base64
 import json
+import os
 import typing
+
+import decouple
 import graphene
-import requests
+import httpx
 from fastapi import Depends, FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse
-from graphene import Enum, Int, String
+from fastapi import Query as QueryParam
+from fastapi.responses import HTMLResponse, StreamingResponse
+from graphene import Enum, Float, Int, String
 from graphene_sqlalchemy import SQLAlchemyObjectType
+from graphql import GraphQLError
 from graphql.execution.executors.asyncio import AsyncioExecutor
-from sqlalchemy import and_, desc, or_, func, cast, Numeric
+from sqlalchemy import and_, desc, or_
+from sqlalchemy.engine import Engine
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload, joinedload
-from sqlalchemy.sql.expression import lateral, cte
 from starlette.graphql import GraphQLApp
-from starlette.responses import JSONResponse
-
-from models import Burn, BuyBack, Pair, Swap, Token
-from processing import XOR_ID, XSTUSD_ID, KUSD_ID, VXOR_ID, DAI_ID, XST_ID
+from starlette.responses import JSONResponse, Response
+
+from analytics import Averages
+from broadcast import Broadcaster
+from dataloader import Loaders
+from market import (
+    IMPORT_CHANNEL,
+    FormattedFloat,
+    get_last_prices_in_dai,
+    get_pairs,
+    get_tickers,
+    render_json,
+)
+from metrics import MetricsMiddleware, instrument, render_metrics
+from models import (
+    CANDLE_INTERVALS,
+    DENOM,
+    Burn,
+    BuyBack,
+    Candle,
+    Pair,
+    Snapshot,
+    Swap,
+    Token,
+)
+from orderbook import MAX_LEVELS, xyk_order_book
+from price_history import PriceHistory, lookup_price
+import queries
+from snapshot_file import SnapshotFile, compress_reply
+from token_registry import token_registry
 
 WHITELIST_URL = "https://raw.githubusercontent.com/sora-xor/polkaswap-token-whitelist-config/master/whitelist.json"  # noqa
+# last downloaded whitelist, used until new one downloaded
+WHITELIST_PATH = decouple.config("WHITELIST_PATH", default="whitelist.json")
+WHITELIST_TIMEOUT = 30
+WHITELIST_REFRESH_INTERVAL = 24 * 3600
+WHITELIST_RETRY_INTERVAL = 60
+
+# max number of candles in /candles/ reply
+MAX_CANDLES = 1000
+
+# rows fetched from DB cursor and sent to client at once by /historical_trades
+TRADES_CHUNK = 1000
+TRADE_FIELDS = (
+    "trade_id",
+    "price",
+    "base_volume",
+    "target_volume",
+    "trade_timestamp",
+    "type",
+    "block",
+    "txid",
+)
+TRADE_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# max number of blocks or timestamps in /price request
+MAX_PRICE_POINTS = 10000
+
+# default window of /twap and /vwap, ms
+AVERAGE_WINDOW = 24 * 3600 * 1000
+
+# how often broadcaster checks for new import, seconds
+BROADCAST_INTERVAL = 2
+# how often LISTEN connection is checked and retried after loss, seconds
+LISTEN_CHECK_INTERVAL = 5
+LISTEN_RETRY_INTERVAL = 10
+# comment sent to idle /events subscribers to keep connection open, seconds
+SSE_KEEPALIVE_INTERVAL = 15
+
+# snapshot file written by importer, shared by workers; per worker cache if not set
+SNAPSHOT_PATH = decouple.config("SNAPSHOT_PATH", default=None)
+
+# replies cached until next import
+__replies = {}
 
-XOR_ID_INT = int(XOR_ID, 16)
-XSTUSD_ID_INT = int(XSTUSD_ID, 16)
-KUSD_ID_INT = int(KUSD_ID, 16)
-VXOR_ID_INT = int(VXOR_ID, 16)
-XST_ID_INT = int(XST_ID, 16)
+# whitelisted tokens, refreshed in background
+__whitelist = {"tokens": [], "ids": frozenset()}
 
-__cache = {}
+# background tasks started with application
+__tasks = []
 
-def get_whitelist():
+# pushes pair updates to /events subscribers
+broadcaster = Broadcaster()
+
+# snapshots shared by workers, see snapshot_file.py
+shared_snapshots = SnapshotFile(SNAPSHOT_PATH) if SNAPSHOT_PATH else None
+
+# version of last import as notified by importer
+__import = {"listening": False, "version": None}
+
+# refresh of pairs for subscribers pending after importer notifications: ids of
+# pairs with new swaps or all pairs of import version, and task running refreshes
+__refresh = {"pairs": set(), "all": False, "version": None, "task": None}
+
+# swaps of pairs queried by batch /price requests
+price_history = PriceHistory()
+
+# /twap and /vwap results
+averages = Averages()
+
+
+def set_whitelist(tokens):
     """
-    Download whitelisted tokens. Cache result for 1 day.
+    Replace whitelisted tokens and precompute set of their ids.
     """
-    KEY = "whitelist"
-    if KEY not in __cache or __cache[KEY]["updated"] < time() - 24 * 3600:
-        __cache[KEY] = {"data": requests.get(
-            WHITELIST_URL).json(), "updated": time()}
-    return __cache["whitelist"]["data"]
+    __whitelist["tokens"] = tokens
+    __whitelist["ids"] = frozenset(int(token["address"], 16) for token in tokens)
+    # replies of pairs that left or joined whitelist are stale
+    __replies.clear()
 
 
-async def get_db():
+def get_whitelist_ids():
     """
-    Open async DB session. To be used as FastAPI dependency.
+    Return set of whitelisted token ids.
     """
-    from db import async_session
+    return __whitelist["ids"]
 
-    async with async_session() as session:
-        yield session
-
-async def get_last_prices_in_dai(session, token_ids: list):
-    dai_id_int = int(DAI_ID, 16)
 
-    latest_swap = lateral(
-        select(
-            Swap.to_amount,
-            Swap.from_amount
-        )
-        .where(Swap.pair_id == Pair.id)
-        .order_by(Swap.timestamp.desc())
-        .limit(1)
-    )
+def load_whitelist():
+    """
+    Load whitelisted tokens saved by previous download. Return False if there are none.
+    """
+    try:
+        with open(WHITELIST_PATH) as f:
+            set_whitelist(json.load(f))
+    except (OSError, ValueError):
+        return False
+    return True
 
-    result = await session.execute(
-        select(
-            Pair.from_token_id,
-            (latest_swap.c.to_amount / latest_swap.c.from_amount).label("last_price"),
-            Pair.quote_price
-        )
-        .join(latest_swap, onclause=True)  # LATERAL JOIN
-        .where(Pair.from_token_id.in_([cast(id, Numeric(80)) for id in token_ids]))
-        .where(Pair.to_token_id == cast(dai_id_int, Numeric(80)))
-    )
 
-    token_prices = {row[0]: row[2] or row[1] or 0 for row in result.all()}
+async def download_whitelist():
+    """
+    Download whitelisted tokens and save them for cold starts.
+    """
+    async with httpx.AsyncClient(timeout=WHITELIST_TIMEOUT) as client:
+        response = await client.get(WHITELIST_URL)
+        response.raise_for_status()
+        tokens = response.json()
+    set_whitelist(tokens)
+    # write to temporary file first to never leave partially written one,
+    # it is named by process as each worker downloads whitelist
+    tmp_path = "%s.%i.tmp" % (WHITELIST_PATH, os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(tokens, f)
+    os.replace(tmp_path, WHITELIST_PATH)
+
+
+async def refresh_whitelist(delay=0):
+    """
+    Download whitelisted tokens once a day after <delay> seconds, retry in a minute on
+    failure.
+    """
+    await asyncio.sleep(delay)
+    while True:
+        try:
+            await download_whitelist()
+        except (httpx.HTTPError, OSError, ValueError):
+            logging.exception("Failed to download whitelist")
+            await asyncio.sleep(WHITELIST_RETRY_INTERVAL)
+        else:
+            await asyncio.sleep(WHITELIST_REFRESH_INTERVAL)
 
-    xor_price_in_dai = token_prices.get(XOR_ID_INT, 0)
 
-    # If a token doesn't have a direct DAI price, try fetching from XOR
-    missing_tokens = [t for t in token_ids if t not in token_prices]
+async def get_db():
+    """
+    Open async read-only DB session, on replica if there are any.
+    To be used as FastAPI dependency.
+    """
+    from db import read_replicas
 
-    if missing_tokens and xor_price_in_dai:
-        result = await session.execute(
-            select(
-                Pair.from_token_id,
-                (latest_swap.c.to_amount / latest_swap.c.from_amount).label("last_price"),
-                Pair.quote_price
-            )
-            .join(latest_swap, onclause=True)  # LATERAL JOIN
-            .where(Pair.from_token_id.in_([cast(id, Numeric(80)) for id in missing_tokens]))
-            .where(Pair.to_token_id == cast(XOR_ID_INT, Numeric(80)))
-        )
+    async with await read_replicas.session() as session:
+        yield session
 
-        for row in result.all():
-            token_prices[row[0]] = (row[2] or row[1] or 0) * xor_price_in_dai
+def resolve_asset_id(info, key):
+    """
+    Return asset id of token with <key>, as GraphQL exposes tokens by asset ids.
+    """
+    return token_registry.asset_id(info.context["request"].loaders, key)
 
-    return {token_id: token_prices.get(token_id, 0) for token_id in token_ids}
 
 class TokenType(SQLAlchemyObjectType):
+    # integer keys of tokens are internal, id is asset id as before they were added
+    id = Float(required=True)
+    hash = String()
+
     class Meta:
         model = Token
+        exclude_fields = ("asset_id",)
+
+    def resolve_id(self, info):
+        return self.asset_id
 
 
 class PairType(SQLAlchemyObjectType):
+    from_token_id = Float(required=True)
+    to_token_id = Float(required=True)
+
     class Meta:
         model = Pair
 
+    def resolve_from_token_id(self, info):
+        return resolve_asset_id(info, self.from_token_id)
+
+    def resolve_to_token_id(self, info):
+        return resolve_asset_id(info, self.to_token_id)
+
+    def resolve_from_token(self, info):
+        return info.context["request"].loaders.token.load(self.from_token_id)
+
+    def resolve_to_token(self, info):
+        return info.context["request"].loaders.token.load(self.to_token_id)
+
 
 class SwapType(SQLAlchemyObjectType):
     hash = String()
@@ -115,16 +240,35 @@ class SwapType(SQLAlchemyObjectType):
     class Meta:
         model = Swap
 
+    def resolve_pair(self, info):
+        return info.context["request"].loaders.pair.load(self.pair_id)
+
 
 class BurnType(SQLAlchemyObjectType):
+    token_id = Float(required=True)
+
     class Meta:
         model = Burn
 
+    def resolve_token_id(self, info):
+        return resolve_asset_id(info, self.token_id)
+
+    def resolve_token(self, info):
+        return info.context["request"].loaders.token.load(self.token_id)
+
 
 class BuyBackType(SQLAlchemyObjectType):
+    token_id = Float(required=True)
+
     class Meta:
         model = BuyBack
 
+    def resolve_token_id(self, info):
+        return resolve_asset_id(info, self.token_id)
+
+    def resolve_token(self, info):
+        return info.context["request"].loaders.token.load(self.token_id)
+
 
 class OrderDirection(Enum):
     asc = 1
@@ -153,7 +297,150 @@ async def resolve_paginated(
         )
     if skip:
         q = q.offset(skip)
-    return [s for s, in await info.context["request"].db.execute(q)]
+    return [s for s, in await info.context["request"].loaders.execute(q)]
+
+
+# max number of items in GraphQL reply
+MAX_PAGE_SIZE = 1000
+
+
+class SwapConnection(graphene.relay.Connection):
+    class Meta:
+        node = SwapType
+
+
+class BurnConnection(graphene.relay.Connection):
+    class Meta:
+        node = BurnType
+
+
+class BuyBackConnection(graphene.relay.Connection):
+    class Meta:
+        node = BuyBackType
+
+
+def encode_cursor(item):
+    """
+    Return opaque cursor pointing at <item>: its (timestamp, id) key.
+    """
+    return base64.urlsafe_b64encode(
+        ("%i:%i" % (item.timestamp, item.id)).encode()
+    ).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Return (timestamp, id) of <cursor>.
+    """
+    try:
+        timestamp, id = base64.urlsafe_b64decode(cursor.encode()).split(b":")
+        return int(timestamp), int(id)
+    except (ValueError, TypeError):
+        raise GraphQLError("Invalid cursor: %s" % cursor)
+
+
+def keyset_after(model, cursor, descending):
+    """
+    Condition selecting rows following <cursor> in (timestamp, id) order.
+    Written as plain comparisons so that timestamp indexes can be used.
+    """
+    timestamp, id = decode_cursor(cursor)
+    if descending:
+        return and_(
+            model.timestamp <= timestamp,
+            or_(model.timestamp < timestamp, model.id < id),
+        )
+    return and_(
+        model.timestamp >= timestamp,
+        or_(model.timestamp > timestamp, model.id > id),
+    )
+
+
+async def resolve_connection(
+    connection,
+    q,
+    model,
+    info,
+    first=None,
+    last=None,
+    after=None,
+    before=None,
+    orderDirection=None,
+    fromTimestamp=None,
+    toTimestamp=None,
+    fromBlock=None,
+    toBlock=None,
+):
+    """
+    Return page of <connection> with <first> rows of <q> following <after> cursor
+    or <last> rows preceding <before> cursor, optionally within timestamp and block
+    ranges (from inclusive, to exclusive).
+    Rows are ordered by (timestamp, id), newest first by default, and pages are
+    selected by key instead of offset, so every page costs the same regardless of
+    its depth.
+    """
+    backwards = last is not None or (before is not None and first is None)
+    size = last if last is not None else first if first is not None else 10
+    size = max(0, min(MAX_PAGE_SIZE, size))
+    descending = orderDirection != OrderDirection.asc
+    if fromTimestamp is not None:
+        q = q.where(model.timestamp >= int(fromTimestamp))
+    if toTimestamp is not None:
+        q = q.where(model.timestamp < int(toTimestamp))
+    q = queries.in_blocks(q, model, fromBlock, toBlock)
+    if after is not None:
+        q = q.where(keyset_after(model, after, descending))
+    if before is not None:
+        q = q.where(keyset_after(model, before, not descending))
+    if backwards:
+        # walk from the end and restore order of the page afterwards
+        descending = not descending
+    order = (desc(model.timestamp), desc(model.id)) if descending else (
+        model.timestamp, model.id
+    )
+    items = [
+        i for i, in await info.context["request"].loaders.execute(
+            q.order_by(*order).limit(size + 1)
+        )
+    ]
+    has_more = len(items) > size
+    items = items[:size]
+    if backwards:
+        items.reverse()
+    return connection(
+        edges=[
+            connection.Edge(node=item, cursor=encode_cursor(item)) for item in items
+        ],
+        page_info=graphene.relay.PageInfo(
+            start_cursor=encode_cursor(items[0]) if items else None,
+            end_cursor=encode_cursor(items[-1]) if items else None,
+            has_next_page=before is not None if backwards else has_more,
+            has_previous_page=has_more if backwards else after is not None,
+        ),
+    )
+
+
+def connection_field(connection, **filters):
+    return graphene.relay.ConnectionField(
+        connection,
+        orderDirection=OrderDirection(),
+        fromTimestamp=graphene.Float(),
+        toTimestamp=graphene.Float(),
+        fromBlock=Int(),
+        toBlock=Int(),
+        **filters,
+    )
+
+
+async def parse_token_id(info, token):
+    """
+    Return key of token given by its 0x-prefixed hex address, None if it is unknown.
+    """
+    try:
+        asset_id = int(token, 16)
+    except ValueError:
+        raise GraphQLError("Invalid token: %s" % token)
+    return await token_registry.key(info.context["request"].loaders, asset_id)
 
 
 class Query(graphene.ObjectType):
@@ -181,33 +468,125 @@ class Query(graphene.ObjectType):
         orderDirection=OrderDirection(),
     )
 
+    swaps_connection = connection_field(SwapConnection, pair=Int(), token=String())
+    burns_connection = connection_field(BurnConnection, token=String())
+    buy_backs_connection = connection_field(BuyBackConnection, token=String())
+
     async def resolve_tokens(self, info):
         q = select(Token)
-        return [t for t, in await info.context["request"].db.execute(q)]
+        return [t for t, in await info.context["request"].loaders.execute(q)]
 
     async def resolve_pairs(self, info):
-        q = select(Pair).options(
-            selectinload(Pair.from_token), selectinload(Pair.to_token)
-        )
-        return [p for p, in await info.context["request"].db.execute(q)]
+        q = select(Pair)
+        return [p for p, in await info.context["request"].loaders.execute(q)]
 
     async def resolve_swaps(self, info, **kwargs):
-        q = select(Swap).options(
-            selectinload(Swap.pair).selectinload(Pair.from_token),
-            selectinload(Swap.pair).selectinload(Pair.to_token),
-        )
-        return resolve_paginated(q, info, **kwargs)
+        return await resolve_paginated(select(Swap), info, **kwargs)
 
     async def resolve_burns(self, info, **kwargs):
-        q = select(Burn).options(selectinload(Burn.token))
-        return resolve_paginated(q, info, **kwargs)
+        return await resolve_paginated(select(Burn), info, **kwargs)
 
     async def resolve_buy_backs(self, info, **kwargs):
-        q = select(BuyBack).options(selectinload(BuyBack.token))
-        return resolve_paginated(q, info, **kwargs)
+        return await resolve_paginated(select(BuyBack), info, **kwargs)
+
+    async def resolve_swaps_connection(self, info, pair=None, token=None, **kwargs):
+        q = select(Swap)
+        if pair is not None:
+            q = q.where(Swap.pair_id == pair)
+        if token is not None:
+            # unknown token has no key and matches nothing
+            token = await parse_token_id(info, token)
+            pairs = select(Pair.id).where(
+                or_(Pair.from_token_id == token, Pair.to_token_id == token)
+            )
+            q = q.where(Swap.pair_id.in_(pairs))
+        return await resolve_connection(SwapConnection, q, Swap, info, **kwargs)
+
+    async def resolve_burns_connection(self, info, token=None, **kwargs):
+        q = select(Burn)
+        if token is not None:
+            q = q.where(Burn.token_id == await parse_token_id(info, token))
+        return await resolve_connection(BurnConnection, q, Burn, info, **kwargs)
+
+    async def resolve_buy_backs_connection(self, info, token=None, **kwargs):
+        q = select(BuyBack)
+        if token is not None:
+            q = q.where(BuyBack.token_id == await parse_token_id(info, token))
+        return await resolve_connection(BuyBackConnection, q, BuyBack, info, **kwargs)
+
+
+class RunningLoopExecutor(AsyncioExecutor):
+    """
+    AsyncioExecutor using loop of current request instead of loop it was created in,
+    so that it can be created once at import.
+    """
+
+    def __init__(self):
+        self.futures = []
+
+    @property
+    def loop(self):
+        return asyncio.get_event_loop()
+
+
+graphql_app = GraphQLApp(
+    schema=graphene.Schema(query=Query), executor=RunningLoopExecutor()
+)
 
 
 app = FastAPI()
+app.add_middleware(MetricsMiddleware, routes=app.router.routes)
+
+# time SQL statements of all engines
+instrument(Engine)
+
+
+@app.on_event("startup")
+async def start_whitelist_refresh():
+    """
+    Load saved whitelist, download it if there is none, then refresh in background.
+    """
+    delay = 0
+    if not load_whitelist():
+        try:
+            await download_whitelist()
+            delay = WHITELIST_REFRESH_INTERVAL
+        except (httpx.HTTPError, OSError, ValueError):
+            logging.exception("Failed to download whitelist")
+            delay = WHITELIST_RETRY_INTERVAL
+    __tasks.append(asyncio.create_task(refresh_whitelist(delay)))
+
+
+@app.on_event("startup")
+async def start_broadcaster():
+    """
+    Start pushing pair updates to /events subscribers.
+    """
+    from db import async_session
+
+    __tasks.append(
+        asyncio.create_task(
+            broadcaster.poll(async_session, BROADCAST_INTERVAL, get_import_version)
+        )
+    )
+
+
+@app.on_event("startup")
+async def start_import_listener():
+    """
+    Listen to importer notifications, PostgreSQL only.
+    """
+    from db import engine
+
+    if engine.dialect.name == "postgresql":
+        __tasks.append(asyncio.create_task(listen_imports()))
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in __tasks:
+        task.cancel()
+
 # logger = logging.getLogger(__name__)
 # logger.setLevel(logging.INFO)
 # logger.addHandler(logging.StreamHandler())
@@ -225,298 +604,657 @@ async def root():
         <li><a href="/tickers/">Tickers Summary</a></li>
         <li><a href="/pairs/">Pair Summary</a></li>
         <li><a href="/pairs/VAL-XOR/">Specific Pair Info</a></li>
+        <li><a href="/candles/VAL-XOR/?interval=1h">Pair Candles</a></li>
+        <li><a href="/price?pair=VAL-XOR&block=1000000">Pair Price at Block</a></li>
+        <li><a href="/twap?pair=VAL-XOR">Pair TWAP</a></li>
+        <li><a href="/prices">Token Prices in USD</a></li>
+        <li><a href="/vwap?pair=VAL-XOR">Pair VWAP</a></li>
+        <li><a href="/historical_trades?ticker_id=0x0200040000000000000000000000000000000000000000000000000000000000_0x0200000000000000000000000000000000000000000000000000000000000000&limit=100">Historical Trades</a></li>
+        <li><a href="/orderbook?ticker_id=0x0200040000000000000000000000000000000000000000000000000000000000_0x0200000000000000000000000000000000000000000000000000000000000000">Order Book</a></li>
         <li><a href="/graph">GraphQL API</a></li>
         <li><a href="/docs">Docs</a></li>
         </ul>
         """
 
 
-class FormattedFloat(float):
-    def __repr__(self):
-        # remove redundant 0 after formatting and then remove . if it is integer number
-        return '{:.18f}'.format(self).rstrip('0').rstrip('.')
+class FormattedJSONResponse(JSONResponse):
+    media_type = "application/json"
 
+    def render(self, content: typing.Any) -> bytes:
+        return render_json(content)
 
-class JsonFloatEncoder(json.JSONEncoder):
-    def encode(self, val):
-        if isinstance(val, dict):
-            return {k: self.encode(v) for k, v in val.items()}
 
-        if isinstance(val, (list, tuple)):
-            return type(val)(self.encode(v) for v in val)
+async def snapshot_or(session, name: str, compute):
+    """
+    Return reply precomputed by importer or compute it if there is no snapshot yet.
+    """
+    snapshot = await session.get(Snapshot, name)
+    if snapshot:
+        return Response(snapshot.data, media_type=FormattedJSONResponse.media_type)
+    return FormattedJSONResponse(await compute(session))
 
-        if isinstance(val, float):
-            return FormattedFloat(val)
 
-        return val
+async def get_import_version(session):
+    """
+    Return (block, updated) of last import or None if nothing imported yet.
+    Snapshots are written by importer together, so "pairs" one identifies import.
+    Known without query while importer notifications are received.
+    """
+    if __import["listening"]:
+        return __import["version"]
+    version = (
+        await session.execute(
+            select(Snapshot.block, Snapshot.updated).where(Snapshot.name == "pairs")
+        )
+    ).first()
+    return tuple(version) if version else None
 
 
-class FormattedJSONResponse(JSONResponse):
-    media_type = "application/json"
+def on_import(connection, pid, channel, payload):
+    """
+    Handle importer notification: switch to new import version, drop cached replies
+    of pairs with new swaps and push their updates to subscribers.
+    """
+    data = json.loads(payload)
+    if "version" in data:
+        __import["version"] = __refresh["version"] = tuple(data["version"])
+        __refresh["all"] = True
+    pair_ids = data.get("pairs")
+    if pair_ids:
+        changed = set(pair_ids)
+        for key, entry in list(__replies.items()):
+            if entry["pairs"] & changed:
+                del __replies[key]
+        averages.invalidate(changed)
+        __refresh["pairs"] |= changed
+    # notifications arriving while refreshing are merged into the next refresh
+    if __refresh["task"] is None or __refresh["task"].done():
+        __refresh["task"] = asyncio.ensure_future(refresh_pending())
+
+
+async def refresh_pending():
+    """
+    Refresh pairs of pending importer notifications for subscribers until there
+    are none, one refresh at a time so updates are published in import order.
+    """
+    while __refresh["all"] or __refresh["pairs"]:
+        if __refresh["all"]:
+            # all pairs are reloaded, pairs with new swaps too
+            pair_ids, version = None, __refresh["version"]
+        else:
+            pair_ids, version = sorted(__refresh["pairs"]), None
+        __refresh["all"] = False
+        __refresh["pairs"] = set()
+        await refresh_broadcaster(pair_ids, version)
 
-    def render(self, content: typing.Any) -> bytes:
-        return json.dumps(
-            str(content).replace("'", "\"").replace(", ", ",").replace(": ", ":"),
-            cls=JsonFloatEncoder,
-            ensure_ascii=False,
-            allow_nan=False,
-            indent=None,
-            separators=(",", ":"),
-        ).encode("utf-8")
+
+async def refresh_broadcaster(pair_ids=None, version=None):
+    from db import async_session
+
+    try:
+        async with async_session() as session:
+            await broadcaster.refresh(session, pair_ids, version)
+    except Exception:
+        logging.exception("Failed to refresh pairs for subscribers")
+
+
+async def listen_imports():
+    """
+    Hold connection listening to importer notifications on IMPORT_CHANNEL,
+    reconnect if it is lost.
+    """
+    from db import REPLICA_URLS, async_session, engine
+
+    while True:
+        try:
+            async with engine.connect() as conn:
+                raw = await conn.get_raw_connection()
+                listener = raw.connection.driver_connection
+                await listener.add_listener(IMPORT_CHANNEL, on_import)
+                # read version after LISTEN to not miss import finished meanwhile
+                async with async_session() as session:
+                    __import["version"] = await get_import_version(session)
+                # replicas may lag behind primary, so with them version is read
+                # from replica serving request and notifications only drop replies
+                __import["listening"] = not REPLICA_URLS
+                while not listener.is_closed():
+                    await asyncio.sleep(LISTEN_CHECK_INTERVAL)
+        except Exception:
+            logging.exception("Lost connection listening to importer")
+        finally:
+            __import["listening"] = False
+        await asyncio.sleep(LISTEN_RETRY_INTERVAL)
+
+
+def accepted_encodings(request: Request):
+    """
+    Return content codings accepted by client, ignoring ones with q=0.
+    """
+    encodings = set()
+    for item in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = item.partition(";")
+        params = params.strip()
+        try:
+            q = float(params[2:]) if params.startswith("q=") else 1
+        except ValueError:
+            q = 1
+        if q > 0:
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+async def cached_reply(request: Request, session, key, build):
+    """
+    Return reply of <build>() cached until next import. Reply is compressed
+    according to Accept-Encoding, 304 Not Modified returned if client has it already.
+    """
+    version = await get_import_version(session)
+    if version is None:
+        return await build()
+    entry = __replies.get(key)
+    if entry is None or entry["version"] != version:
+        response = await build()
+        entry = __replies[key] = compress_reply(
+            version, response.body, getattr(response, "pair_ids", None)
+        )
+    return send_cached(request, entry)
+
+
+def send_cached(request: Request, entry):
+    """
+    Return reply of compress_reply() <entry> compressed according to Accept-Encoding
+    or 304 Not Modified if client has it already.
+    """
+    headers = {"ETag": entry["etag"], "Vary": "Accept-Encoding"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or entry["etag"] in [
+        tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")
+    ]:
+        return Response(status_code=304, headers=headers)
+    encodings = accepted_encodings(request)
+    coding = next((c for c in ("br", "gzip") if c in encodings), "identity")
+    if coding != "identity":
+        headers["Content-Encoding"] = coding
+    return BodyResponse(
+        entry["bodies"][coding],
+        media_type=FormattedJSONResponse.media_type,
+        headers=headers,
+    )
+
+
+class BodyResponse(Response):
+    """
+    Response sending bytes-like body, e.g. memoryview of snapshot file, as is.
+    """
+
+    def render(self, content) -> typing.Union[bytes, memoryview]:
+        return content
 
 
 @app.get("/pairs/")
-async def pairs(session=Depends(get_db)):
+async def pairs(request: Request, session=Depends(get_db)):
     """
     Returns information on pairs.
     """
-    pairs = {}
-    # fetch all pairs info
-    # select last swap for each pair in subquery to obtain price
-    for p, last_price in await session.execute(
-        select(
-            Pair,
-            select(Swap.to_amount / Swap.from_amount)
-            .where(Swap.pair_id == Pair.id)
-            .order_by(Swap.timestamp.desc())
-            .limit(1)
-            .scalar_subquery(),
-        ).options(selectinload(Pair.from_token), selectinload(Pair.to_token))
-    ):
-        # there are separate pairs for selling and buying XOR
-        # need to sum them to calculate total volumes
-        if p.from_token_id == XOR_ID_INT or p.from_token_id == XSTUSD_ID_INT \
-              or p.from_token_id == KUSD_ID_INT or p.from_token_id == VXOR_ID_INT:
-            # <p> contains XOR->XXX swaps
-            base = p.to_token
-            base_volume = p.to_volume
-            quote = p.from_token
-            quote_volume = p.from_volume
-            quote_price = p.quote_price
-            if quote_price:
-                quote_price = 1 / quote_price
-            if last_price:
-                # reverse price
-                last_price = 1 / last_price
-        else:
-            base = p.from_token
-            base_volume = p.from_volume
-            quote = p.to_token
-            quote_volume = p.to_volume
-            quote_price = p.quote_price
-        # quote is always XOR
-        id = base.hash + "_" + quote.hash
-        if id in pairs:
-            # sum up buying and sellling volumes
-            if base_volume:
-                pairs[id]["base_volume"] += FormattedFloat(base_volume)
-            if quote_volume:
-                pairs[id]["quote_volume"] += FormattedFloat(quote_volume)
-        elif (quote_price is None and last_price == 0) or (last_price is None and quote_price == 0) or \
-            (last_price is None and quote_price is None):
-            continue
-        else:
-            pairs[id] = {
-                "base_id": base.hash,
-                "base_name": base.name,
-                "base_symbol": base.symbol,
-                "quote_id": quote.hash,
-                "quote_name": quote.name,
-                "quote_symbol": quote.symbol,
-                "last_price": FormattedFloat(quote_price or last_price),
-                "base_volume": FormattedFloat(base_volume or 0),
-                "quote_volume": FormattedFloat(quote_volume or 0),
-            }
-    return FormattedJSONResponse(pairs)
+    entry = shared_snapshots.get("pairs") if shared_snapshots else None
+    if entry:
+        return send_cached(request, entry)
+    return await cached_reply(
+        request, session, "pairs", lambda: snapshot_or(session, "pairs", get_pairs)
+    )
+
 
 @app.get("/tickers/")
-async def tickers(session=Depends(get_db)):
+async def tickers(request: Request, session=Depends(get_db)):
     """
     Return information on tickers(pairs).
 
     Pools just use token_id -> token_id as identifier, so pool_id not included
     """
-    pairs = {}
-    last_24h = (time() - 24 * 3600) * 1000
-    prices_in_dai = await get_last_prices_in_dai(session, [XOR_ID_INT, XSTUSD_ID_INT, KUSD_ID_INT, VXOR_ID_INT, XST_ID_INT])
-
-    swap_stats = cte(
-        select(
-            Swap.pair_id,
-            func.max(Swap.to_amount / Swap.from_amount).label("high_price"),
-            func.min(Swap.to_amount / Swap.from_amount).label("low_price")
-        )
-        .where(Swap.timestamp >= last_24h)
-        .group_by(Swap.pair_id)
+    entry = shared_snapshots.get("tickers") if shared_snapshots else None
+    if entry:
+        return send_cached(request, entry)
+    return await cached_reply(
+        request,
+        session,
+        "tickers",
+        lambda: snapshot_or(session, "tickers", get_tickers),
     )
 
-    latest_swap = lateral(
-        select(
-            (Swap.to_amount / Swap.from_amount).label("last_price")
-        )
-        .where(Swap.pair_id == Pair.id)
-        .order_by(Swap.timestamp.desc())
-        .limit(1)
-    )
 
-    query = (
-        select(
-            Pair,
-            latest_swap.c.last_price,
-            swap_stats.c.high_price,
-            swap_stats.c.low_price
-        )
-        .select_from(Pair)
-        .join(latest_swap, onclause=True)  # LATERAL JOIN
-        .join(swap_stats, swap_stats.c.pair_id == Pair.id, isouter=True)
-        .options(joinedload(Pair.from_token), joinedload(Pair.to_token))
+async def get_pair_by_symbols(session, base: str, quote: str):
+    """
+    Return whitelisted base->quote pair with its tokens and reverse quote->base pair.
+    Raise 404 error if there is no such pair.
+    """
+    whitelist = get_whitelist_ids()
+    # there may be tokens with the same symbols, pick whitelisted ones
+    pairs = await session.execute(queries.pairs_by_symbols(base, quote))
+    for pair in pairs.scalars():
+        if {pair.from_token.asset_id, pair.to_token.asset_id} <= whitelist:
+            break
+    else:
+        raise HTTPException(status_code=404, detail="Pair not found")
+    reverse = await session.execute(
+        queries.pair_by_tokens(pair.to_token_id, pair.from_token_id)
     )
+    return pair, reverse.scalar()
 
-    request_result = await session.execute(query)
-
-    # fetch all pairs info
-    # select last swap for each pair in subquery to obtain price
-    for p, last_price, high_price, low_price in request_result:
-        # there are separate pairs for selling and buying XOR
-        # need to sum them to calculate total volumes
-        if p.from_token_id == XOR_ID_INT or p.from_token_id == XSTUSD_ID_INT \
-              or p.from_token_id == KUSD_ID_INT or p.from_token_id == VXOR_ID_INT \
-                or p.from_token_id == XST_ID_INT:
-            # <p> contains XOR->XXX swaps
-            base = p.to_token
-            base_volume = p.to_volume
-            quote = p.from_token
-            quote_volume = p.from_volume
-            quote_price = p.quote_price
-            if quote_price:
-                quote_price = 1 / quote_price
-            # reverse price
-            if last_price:
-                last_price = 1 / last_price
-            liquidity_in_dai = ((p.from_token_liquidity or 0) + (p.to_token_liquidity or 0) * (quote_price or last_price or 0))\
-                * prices_in_dai[p.from_token_id]
-            if low_price or high_price:
-                high_price, low_price = (1 / low_price if low_price else None, 
-                                         1 / high_price if high_price else None)
-        elif p.to_token_id == XOR_ID_INT or p.to_token_id == XSTUSD_ID_INT \
-              or p.to_token_id == KUSD_ID_INT or p.to_token_id == VXOR_ID_INT \
-                or p.to_token_id == XST_ID_INT:
-            base = p.from_token
-            base_volume = p.from_volume
-            quote = p.to_token
-            quote_volume = p.to_volume
-            quote_price = p.quote_price
-            liquidity_in_dai = ((p.from_token_liquidity or 0) * (quote_price or last_price or 0) + (p.to_token_liquidity or 0))\
-                * prices_in_dai[p.to_token_id]
-        else:
-            continue
-
-        id = base.hash + "_" + quote.hash
-        rev_id = quote.hash + "_" + base.hash
-
-        if rev_id in pairs:
-            liquidity_in_dai = pairs[rev_id]["liquidity_in_usd"] = max(FormattedFloat(liquidity_in_dai), pairs[rev_id]["liquidity_in_usd"])
-            quote_volume = pairs[rev_id]["base_volume"] = pairs[rev_id]["base_volume"] + FormattedFloat(quote_volume or 0)
-            base_volume = pairs[rev_id]["target_volume"] = pairs[rev_id]["target_volume"] + FormattedFloat(base_volume or 0)
-        if id in pairs:
-            # sum up buying and sellling volumes
-            if base_volume:
-                pairs[id]["base_volume"] += FormattedFloat(base_volume or 0)
-            if quote_volume:
-                pairs[id]["target_volume"] += FormattedFloat(quote_volume or 0)
-        elif (quote_price is None and last_price == 0) or (last_price is None and quote_price == 0) or \
-            (last_price is None and quote_price is None):
-            continue
-        else:
-            pairs[id] = {
-                "ticker_id": id,
-                "base_currency": base.hash,
-                "base_name": base.name,
-                "base_symbol": base.symbol, 
-                "target_currency": quote.hash,
-                "target_name": quote.name,
-                "target_symbol": quote.symbol,
-                "last_price": FormattedFloat(last_price or quote_price), 
-                "base_volume": FormattedFloat(base_volume or 0),
-                "target_volume": FormattedFloat(quote_volume or 0),
-                "liquidity_in_usd": FormattedFloat(liquidity_in_dai),
-                "high": FormattedFloat(high_price or 0),
-                "low": FormattedFloat(low_price or 0),
-            }
-    return FormattedJSONResponse(list(pairs.values()))
 
 @app.get("/pairs/{base}-{quote}/")
-async def pair(base: str, quote: str, session=Depends(get_db)):
+async def pair(base: str, quote: str, request: Request, session=Depends(get_db)):
     """
     Return pricing and volume information on specific pair.
     """
-    # get pair and its tokens info
-    from_token = Token.__table__.alias("from_token")
-    to_token = Token.__table__.alias("to_token")
-    whitelist = [Decimal(int(token["address"], 16))
-                 for token in get_whitelist()]
-    # get volume of base->quote swaps
-    pair = await session.execute(
-        select(Pair)
-        .options(selectinload(Pair.from_token), selectinload(Pair.to_token))
-        .join(from_token, from_token.c.id == Pair.from_token_id)
-        .join(to_token, to_token.c.id == Pair.to_token_id)
-        .where(
-            and_(
-                from_token.c.id.in_(whitelist),
-                to_token.c.id.in_(whitelist),
-                from_token.c.symbol == base,
-                to_token.c.symbol == quote,
-            )
-        )
+    return await cached_reply(
+        request,
+        session,
+        ("pair", base, quote),
+        lambda: get_pair_reply(session, base, quote),
     )
-    pair = pair.scalar()
-    if not pair:
-        raise HTTPException(status_code=404, detail="Pair not found")
+
+
+async def get_pair_reply(session, base: str, quote: str):
+    # get pair and its tokens info, reverse pair has volume of quote->base swaps
+    pair, reverse = await get_pair_by_symbols(session, base, quote)
     base = pair.from_token
     quote = pair.to_token
-    # get volume of quote->base swaps
-    reverse = await session.execute(
-        select(Pair).where(
-            Pair.from_token_id == pair.to_token_id,
-            Pair.to_token_id == pair.from_token_id,
-        )
-    )
     base_volume = pair.from_volume or 0
     quote_volume = pair.to_volume or 0
-    reverse = reverse.scalar()
     # sum up volumes
     if reverse and reverse.to_volume and reverse.from_volume:
         base_volume += reverse.to_volume
         quote_volume += reverse.from_volume
-    # query current price (price of last swap of such pair)
-    last_swap = (
-        await session.execute(
-            select(Swap)
-            .where(or_(Swap.pair_id == pair.id, Swap.pair_id == reverse.id))
-            .order_by(Swap.timestamp.desc())
-            .limit(1)
-        )
-    ).scalar()
+    # last swap of either direction, price of reverse pair is inverted
+    last = pair
+    if reverse and reverse.last_timestamp is not None and (
+        pair.last_timestamp is None or reverse.last_timestamp > pair.last_timestamp
+    ):
+        last = reverse
     if pair.quote_price:
         last_price = pair.quote_price
-    elif last_swap.pair_id == pair.id:
-        last_price = last_swap.to_amount / last_swap.from_amount
+    elif last is pair:
+        last_price = pair.last_price
     else:
-        last_price = last_swap.from_amount / last_swap.to_amount
-    return FormattedJSONResponse({
+        last_price = 1 / reverse.last_price
+    response = FormattedJSONResponse({
         "base_id": base.hash,
         "base_name": base.name,
         "base_symbol": base.symbol,
         "quote_id": quote.hash,
         "quote_name": quote.name,
         "quote_symbol": quote.symbol,
-        "last_block": last_swap.block,
-        "last_txid": last_swap.hash,
+        "last_block": last.last_block,
+        "last_txid": last.last_hash,
         "last_price": FormattedFloat(last_price),
         "base_volume": FormattedFloat(base_volume),
         "quote_volume": FormattedFloat(quote_volume),
     })
+    # cached reply is dropped when importer adds swaps of these pairs
+    response.pair_ids = [p.id for p in (pair, reverse) if p]
+    return response
+
+
+def invert(price):
+    return 1 / price if price else 0
+
+
+@app.get("/candles/{base}-{quote}/")
+async def candles(
+    base: str,
+    quote: str,
+    interval: str = "1h",
+    from_: int = QueryParam(None, alias="from"),
+    to: int = None,
+    session=Depends(get_db),
+):
+    """
+    Return OHLCV candles of pair with swaps in both directions.
+    Timestamps in ms, prices in quote tokens for one base token.
+    """
+    if interval not in CANDLE_INTERVALS:
+        raise HTTPException(
+            status_code=400,
+            detail="Unknown interval, use one of: " + ", ".join(CANDLE_INTERVALS),
+        )
+    seconds = CANDLE_INTERVALS[interval]
+    if to is None:
+        to = int(time() * 1000)
+    # limit max reply size
+    from_ = max(from_ or 0, to - MAX_CANDLES * seconds * 1000)
+    pair, reverse = await get_pair_by_symbols(session, base, quote)
+    pair_ids = [pair.id] + ([reverse.id] if reverse else [])
+    merged = {}
+    for c in (
+        await session.execute(queries.pair_candles(pair_ids, seconds, from_, to))
+    ).scalars():
+        if c.pair_id == pair.id:
+            candle = (c.open, c.high, c.low, c.close, c.from_volume, c.to_volume)
+        else:
+            # quote->base swaps, reverse prices and volumes
+            candle = (
+                invert(c.open),
+                invert(c.low),
+                invert(c.high),
+                invert(c.close),
+                c.to_volume,
+                c.from_volume,
+            )
+        merged.setdefault(c.timestamp, []).append(
+            candle + (c.swaps, c.open_timestamp, c.close_timestamp)
+        )
+    result = []
+    for timestamp in sorted(merged):
+        candle = Candle.merge(merged[timestamp])
+        result.append({
+            "timestamp": timestamp,
+            "open": FormattedFloat(candle["open"]),
+            "high": FormattedFloat(candle["high"]),
+            "low": FormattedFloat(candle["low"]),
+            "close": FormattedFloat(candle["close"]),
+            "base_volume": FormattedFloat(candle["from_volume"]),
+            "quote_volume": FormattedFloat(candle["to_volume"]),
+            "swaps": candle["swaps"],
+        })
+    return FormattedJSONResponse(result)
+
+
+def parse_pair(pair: str):
+    """
+    Return (base, quote) symbols of "<base>-<quote>" pair.
+    """
+    try:
+        base, quote = pair.split("-")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid pair")
+    return base, quote
+
+
+@app.get("/price")
+async def price(
+    pair: str,
+    block: typing.List[int] = QueryParam(None),
+    timestamp: typing.List[int] = QueryParam(None),
+    session=Depends(get_db),
+):
+    """
+    Return price of pair ("<base>-<quote>" symbols as in /pairs/) as of last swap in
+    either direction at or before each of given blocks or timestamps (in ms).
+    Both parameters can be repeated, only one of them can be used at a time.
+    """
+    if bool(block) == bool(timestamp):
+        raise HTTPException(
+            status_code=400, detail="Either block or timestamp is required"
+        )
+    column, values = ("block", block) if block else ("timestamp", timestamp)
+    if len(values) > MAX_PRICE_POINTS:
+        raise HTTPException(
+            status_code=400,
+            detail="Too many values of %s, max %i" % (column, MAX_PRICE_POINTS),
+        )
+    base, quote = parse_pair(pair)
+    pair, reverse = await get_pair_by_symbols(session, base, quote)
+    pair_ids = [p.id for p in (pair, reverse) if p]
+    if len(values) == 1:
+        prices = [await lookup_price(session, pair_ids, pair.id, column, values[0])]
+    else:
+        prices = await price_history.lookup(session, pair_ids, pair.id, column, values)
+    return FormattedJSONResponse({
+        "base_symbol": base,
+        "quote_symbol": quote,
+        "prices": [
+            {
+                column: value,
+                "price": FormattedFloat(last[0]) if last else None,
+                "swap_block": last[1] if last else None,
+                "swap_timestamp": last[2] if last else None,
+            }
+            for value, last in zip(values, prices)
+        ],
+    })
+
+
+async def get_averages(session, pair: str, from_: int, to: int):
+    """
+    Return pair symbols, window and average_prices() of pair ("<base>-<quote>"
+    symbols as in /pairs/) in [<from_>, <to>), last 24h by default.
+    """
+    if to is None:
+        # whole minutes, so that repeated requests hit cache
+        to = int(time() * 1000) // 60000 * 60000
+    if from_ is None:
+        from_ = to - AVERAGE_WINDOW
+    if from_ >= to:
+        raise HTTPException(status_code=400, detail="Empty window")
+    base, quote = parse_pair(pair)
+    pair, reverse = await get_pair_by_symbols(session, base, quote)
+    result = await averages.get(
+        session,
+        [p.id for p in (pair, reverse) if p],
+        pair.id,
+        from_,
+        to,
+        await get_import_version(session),
+    )
+    return {"base_symbol": base, "quote_symbol": quote, "from": from_, "to": to}, result
+
+
+@app.get("/twap")
+async def twap(
+    pair: str,
+    from_: int = QueryParam(None, alias="from"),
+    to: int = None,
+    session=Depends(get_db),
+):
+    """
+    Return time-weighted average price of pair in window [from, to) (ms), swaps in
+    both directions. Price in quote tokens for one base token.
+    """
+    reply, result = await get_averages(session, pair, from_, to)
+    average = result["twap"]
+    reply["twap"] = None if average is None else FormattedFloat(average)
+    reply["swaps"] = result["swaps"]
+    return FormattedJSONResponse(reply)
+
+
+@app.get("/vwap")
+async def vwap(
+    pair: str,
+    from_: int = QueryParam(None, alias="from"),
+    to: int = None,
+    session=Depends(get_db),
+):
+    """
+    Return volume-weighted average price and volumes of pair in window [from, to)
+    (ms), swaps in both directions. Price in quote tokens for one base token.
+    """
+    reply, result = await get_averages(session, pair, from_, to)
+    average = result["vwap"]
+    reply["vwap"] = None if average is None else FormattedFloat(average)
+    reply["base_volume"] = FormattedFloat(result["base_volume"] / float(DENOM))
+    reply["quote_volume"] = FormattedFloat(result["quote_volume"] / float(DENOM))
+    reply["swaps"] = result["swaps"]
+    return FormattedJSONResponse(reply)
+
+
+@app.get("/prices")
+async def token_prices(tokens: str = None, session=Depends(get_db)):
+    """
+    Return USD prices of whitelisted tokens (comma-separated ids, all by default),
+    each resolved through most liquid route to DAI, XSTUSD or KUSD, 0 if there is none.
+    """
+    whitelist = get_whitelist_ids()
+    if tokens is None:
+        token_ids = sorted(whitelist)
+    else:
+        try:
+            token_ids = [int(token, 16) for token in tokens.split(",")]
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid tokens")
+        token_ids = [id for id in token_ids if id in whitelist]
+    prices = await get_last_prices_in_dai(session, token_ids)
+    return FormattedJSONResponse(
+        {"0x%064x" % id: FormattedFloat(price) for id, price in prices.items()}
+    )
+
+
+def parse_ticker_id(ticker_id: str):
+    """
+    Return (base, target) token asset ids of "<base id>_<target id>" ticker id.
+    """
+    try:
+        base, target = ticker_id.split("_")
+        return int(base, 16), int(target, 16)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid ticker_id")
+
+
+async def get_ticker_pairs(session, ticker_id: str):
+    """
+    Return base->target and target->base pairs of ticker, one of them may be None.
+    Raise 404 error if there are none.
+    """
+    # unknown tokens have no key and match no pairs
+    base_id, target_id = [
+        await token_registry.key(session, asset_id)
+        for asset_id in parse_ticker_id(ticker_id)
+    ]
+    pairs = {
+        (p.from_token_id, p.to_token_id): p
+        for p in await session.scalars(queries.ticker_pairs(base_id, target_id))
+    }
+    if not pairs:
+        raise HTTPException(status_code=404, detail="Ticker not found")
+    return pairs.get((base_id, target_id)), pairs.get((target_id, base_id))
+
+
+def format_trades(rows, base_pair_id: int, format: str):
+    """
+    Serialize chunk of (id, timestamp, block, txid, pair_id, from_amount, to_amount)
+    swap rows as trades: lines of NDJSON or CSV.
+    """
+    trades = []
+    for id, timestamp, block, txid, pair_id, from_amount, to_amount in rows:
+        if pair_id == base_pair_id:
+            # base->target swap sells base
+            type, base_amount, target_amount = "sell", from_amount, to_amount
+        else:
+            type, base_amount, target_amount = "buy", to_amount, from_amount
+        trades.append({
+            "trade_id": id,
+            "price": FormattedFloat(target_amount / base_amount if base_amount else 0),
+            "base_volume": FormattedFloat(base_amount / DENOM),
+            "target_volume": FormattedFloat(target_amount / DENOM),
+            "trade_timestamp": timestamp,
+            "type": type,
+            "block": block,
+            "txid": "0x%064x" % int(txid),
+        })
+    if format == "csv":
+        return "".join(
+            ",".join(repr(v) if isinstance(v, float) else str(v) for v in t.values())
+            + "\n"
+            for t in trades
+        ).encode()
+    return b"".join(render_json(t) + b"\n" for t in trades)
+
+
+async def stream_trades(session, q, base_pair_id: int, format: str):
+    """
+    Yield serialized trades of swaps selected by <q> in chunks of TRADES_CHUNK,
+    reading them from server-side cursor.
+    """
+    if format == "csv":
+        yield (",".join(TRADE_FIELDS) + "\n").encode()
+    result = await session.stream(q)
+    async for rows in result.partitions(TRADES_CHUNK):
+        yield format_trades(rows, base_pair_id, format)
+
+
+@app.get("/historical_trades")
+async def historical_trades(
+    ticker_id: str,
+    from_: int = QueryParam(None, alias="from"),
+    to: int = None,
+    limit: int = QueryParam(None, ge=0),
+    format: str = "ndjson",
+    from_block: int = None,
+    to_block: int = None,
+    session=Depends(get_db),
+):
+    """
+    Stream trades of ticker ("<base id>_<target id>" as in /tickers/), newest first,
+    as NDJSON or CSV. Timestamps in ms, price in target tokens for one base token.
+    Ranges of timestamps and blocks include from and exclude to.
+    """
+    if format not in TRADE_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail="Unknown format, use one of: " + ", ".join(TRADE_MEDIA_TYPES),
+        )
+    pair, reverse = await get_ticker_pairs(session, ticker_id)
+    pair_ids = [p.id for p in (pair, reverse) if p]
+    q = queries.trades(pair_ids, from_, to, limit, from_block, to_block)
+    return StreamingResponse(
+        stream_trades(session, q, pair.id if pair else None, format),
+        media_type=TRADE_MEDIA_TYPES[format],
+    )
+
+
+@app.get("/orderbook")
+async def orderbook(
+    ticker_id: str, depth: int = QueryParam(100, ge=0), session=Depends(get_db)
+):
+    """
+    Return order book of ticker ("<base id>_<target id>" as in /tickers/) derived from
+    XYK pool reserves, <depth> levels in total (half on each side), 0 for full depth.
+    Prices in target tokens for one base token, amounts in base tokens.
+    """
+    pair, reverse = await get_ticker_pairs(session, ticker_id)
+    if pair:
+        reserves = pair.from_token_liquidity, pair.to_token_liquidity
+    else:
+        reserves = reverse.to_token_liquidity, reverse.from_token_liquidity
+    levels = min(depth // 2 if depth else MAX_LEVELS, MAX_LEVELS)
+    bids, asks = xyk_order_book(
+        float(reserves[0] or 0), float(reserves[1] or 0), levels
+    )
+    return FormattedJSONResponse({
+        "ticker_id": ticker_id,
+        "timestamp": int(time() * 1000),
+        "bids": [[FormattedFloat(p), FormattedFloat(a)] for p, a in bids],
+        "asks": [[FormattedFloat(p), FormattedFloat(a)] for p, a in asks],
+    })
+
+
+@app.get("/events")
+async def events():
+    """
+    Stream server-sent events: "snapshot" with all pairs on connect,
+    then "update" with pairs changed by each import.
+    """
+    queue = broadcaster.subscribe()
+
+    async def stream():
+        try:
+            yield broadcaster.snapshot()
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield event
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/graph")
@@ -524,9 +1262,7 @@ async def graphql_get(request: Request):
     """
     Return interactive GraphiQL interface.
     """
-    return await GraphQLApp(
-        schema=graphene.Schema(query=Query), executor_class=AsyncioExecutor
-    ).handle_graphql(request)
+    return await graphql_app.handle_graphql(request)
 
 
 @app.post("/graph")
@@ -534,11 +1270,17 @@ async def graphql_post(request: Request, db=Depends(get_db)):
     """
     Handle GraphQL queries.
     """
-    gapp = GraphQLApp(
-        schema=graphene.Schema(query=Query), executor_class=AsyncioExecutor
-    )
-    request.db = db
-    return await gapp.handle_graphql(request)
+    request.loaders = Loaders(db)
+    return await graphql_app.handle_graphql(request)
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Return request latency and SQL statement histograms by route in Prometheus text
+    format. Metrics are per worker process.
+    """
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/healthcheck")